@@ -1,10 +1,15 @@
 import os
+import atexit
 import time
+import asyncio
+import bisect
 import sqlite3
 import logging
-import random
-import string
+import base64
 import re
+import threading
+import functools
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Optional, List
 
@@ -26,8 +31,9 @@ TRADE_EXPIRE_SECONDS = 3 * 60 * 60  # 3 hours
 # Trade channel reminder (anti-spam)
 TRADE_REMINDER_COOLDOWN = 30 * 60  # 30 minutes
 TRADE_REMINDER_MIN_MESSAGES = 12   # only remind after activity
-_last_trade_reminder_ts = 0
-_trade_chat_counter = 0
+# Per guild, so a busy server doesn't use up everyone else's reminders
+_last_trade_reminder_ts: dict[int, int] = {}
+_trade_chat_counter: dict[int, int] = {}
 
 # Report system (scam / sketchy behavior)
 REPORT_CATEGORY_ID = 1460823073765720260  # Trading Hub category
@@ -46,6 +52,14 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CommandOnCooldown):
+        try:
+            await interaction.response.send_message(
+                f"⏳ Slow down — try again in {error.retry_after:.1f}s.", ephemeral=True
+            )
+        except Exception:
+            pass
+        return
     logging.exception("App command error: %s", error)
     try:
         if interaction.response.is_done():
@@ -56,18 +70,131 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
         pass
 
 # -------------------- DB --------------------
+# One shared connection for the whole process (SQLite keeps its page cache per
+# connection, so reopening the file on every helper call threw it away).
+_CON: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.RLock()
+
+def _connect() -> sqlite3.Connection:
+    global _CON
+    if _CON is None:
+        _CON = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        _CON.row_factory = sqlite3.Row
+        # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints
+        mode = _CON.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if str(mode).lower() != "wal":
+            logging.warning(f"SQLite refused WAL mode, running with journal_mode={mode}")
+        _CON.execute("PRAGMA synchronous=NORMAL")
+        _CON.execute("PRAGMA temp_store=MEMORY")
+        _CON.execute("PRAGMA cache_size=-64000")  # ~64 MB
+        _CON.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        _CON.execute("PRAGMA busy_timeout=5000")  # wait for a checkpoint/other writer instead of failing
+        _CON.execute("PRAGMA wal_autocheckpoint=1000")  # pages
+        _CON.execute("PRAGMA analysis_limit=1000")  # ANALYZE/optimize sample per index instead of full scans
+    return _CON
+
+def checkpoint_wal():
+    """Fold the WAL back into the main file and truncate it to zero bytes."""
+    with _DB_LOCK:
+        _connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def optimize_db():
+    """Re-ANALYZE whatever tables have drifted since the last run (cheap when nothing has)."""
+    with _DB_LOCK:
+        _connect().execute("PRAGMA optimize")
+
+def close_db():
+    """Let SQLite refresh planner stats for the indexes it used, then close."""
+    global _CON
+    with _DB_LOCK:
+        if _CON is None:
+            return
+        try:
+            _CON.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logging.warning(f"PRAGMA optimize failed: {e}")
+        _CON.close()
+        _CON = None
+
+atexit.register(close_db)
+
+@contextmanager
 def db():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    # Same semantics as the old `with sqlite3.connect(...) as con:` —
+    # commit on success, rollback on error — but the connection stays open.
+    with _DB_LOCK:
+        con = _connect()
+        with con:
+            yield con
+
+@contextmanager
+def txn():
+    """Multi-statement write as one explicit transaction (one commit).
+
+    BEGIN IMMEDIATE takes the write lock up front, and DDL is included too
+    (the sqlite3 module only opens implicit transactions for DML). Don't call
+    db()-based helpers inside — their exit commits.
+    """
+    with _DB_LOCK:
+        con = _connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+
+async def run_db(fn, *args, **kwargs):
+    # Blocking sqlite helpers run on a worker thread so a slow commit never
+    # stalls the gateway; the shared connection's lock serializes them.
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+# Identical reads issued while one is already running share its result
+_inflight: dict[tuple, asyncio.Future] = {}
+
+async def run_db_once(key: tuple, fn, *args, **kwargs):
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(run_db(fn, *args, **kwargs))
+        _inflight[key] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one caller being cancelled must not cancel the others' query
+    return await asyncio.shield(fut)
+
+# -------------------- Background tasks --------------------
+# The event loop only keeps weak references to tasks, so hold them until done
+_background_tasks: set[asyncio.Task] = set()
+
+def _background_done(task: asyncio.Task, what: str):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.warning(f"Background task failed ({what}): {task.exception()}")
+
+def spawn(coro, what: str) -> asyncio.Task:
+    """Fire-and-forget a coroutine; failures are logged instead of lost."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(lambda t: _background_done(t, what))
+    return task
+
+def add_missing_columns(con: sqlite3.Connection, table: str, columns: dict[str, str]) -> list[str]:
+    """ALTER TABLE ... ADD COLUMN for each of `columns` (name -> type/constraints)
+    the table doesn't have yet; returns the names it added."""
+    existing = {r["name"] for r in con.execute(f"PRAGMA table_info({table})")}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]}")
+    return added
 
 def init_db():
-    with db() as con:
+    # Every CREATE/ALTER/backfill below commits together, or not at all
+    with txn() as con:
         # Core config
         con.execute("""
         CREATE TABLE IF NOT EXISTS guild_config (
             guild_id INTEGER PRIMARY KEY,
-            _channel_id INTEGER,
+            vouch_channel_id INTEGER,
             trade_channel_id INTEGER,
             report_receipts_channel_id INTEGER,
             role_new_id INTEGER,
@@ -150,36 +277,57 @@ def init_db():
             channel_id INTEGER NOT NULL,
             owner_id INTEGER,
             created_at INTEGER NOT NULL,
+            slot INTEGER,
             PRIMARY KEY (guild_id, channel_id)
         )
         """)
 
-        # --- Safe migration: temp_vcs.owner_id ---
-        try:
-            con.execute("ALTER TABLE temp_vcs ADD COLUMN owner_id INTEGER")
-        except sqlite3.OperationalError:
-            pass
-
-# --- Safe migrations for your existing DB ---
-        try:
-            con.execute("ALTER TABLE guild_config ADD COLUMN report_receipts_channel_id INTEGER")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            con.execute("ALTER TABLE guild_config ADD COLUMN trade_channel_id INTEGER")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            con.execute("ALTER TABLE vouches ADD COLUMN trade_id TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            con.execute("ALTER TABLE vouches ADD COLUMN stars INTEGER NOT NULL DEFAULT 5")
-        except sqlite3.OperationalError:
-            pass
+        # --- Safe migrations for existing DBs ---
+        add_missing_columns(con, "temp_vcs", {"owner_id": "INTEGER", "slot": "INTEGER"})
+        add_missing_columns(con, "guild_config", {
+            "vouch_channel_id": "INTEGER",
+            "report_receipts_channel_id": "INTEGER",
+            "trade_channel_id": "INTEGER",
+        })
+        add_missing_columns(con, "vouches", {
+            "trade_id": "TEXT",
+            "stars": "INTEGER NOT NULL DEFAULT 5",
+        })
+
+        # Running vouch count + star sum per trader, kept current by the trigger below
+        # (backfilled from vouches when the table or the stars_sum column is new; after
+        # the migrations above, since it reads vouches.trade_id / stars)
+        has_totals = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='vouch_totals'"
+        ).fetchone()
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS vouch_totals (
+            guild_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            stars_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, target_id)
+        )
+        """)
+        added = add_missing_columns(con, "vouch_totals", {"stars_sum": "INTEGER NOT NULL DEFAULT 0"})
+        if not has_totals or added:
+            con.execute("""
+            INSERT OR REPLACE INTO vouch_totals (guild_id, target_id, total, stars_sum)
+            SELECT guild_id, target_id, COUNT(*), SUM(stars) FROM vouches
+            WHERE trade_id IS NOT NULL
+            GROUP BY guild_id, target_id
+            """)
+        con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vouch_totals
+        AFTER INSERT ON vouches
+        WHEN NEW.trade_id IS NOT NULL
+        BEGIN
+            INSERT INTO vouch_totals (guild_id, target_id, total, stars_sum)
+            VALUES (NEW.guild_id, NEW.target_id, 1, NEW.stars)
+            ON CONFLICT(guild_id, target_id) DO UPDATE
+            SET total = total + 1, stars_sum = stars_sum + excluded.stars_sum;
+        END
+        """)
 
         # One vouch per trade per voucher (prevents spam for same trade)
         con.execute("""
@@ -188,23 +336,108 @@ def init_db():
         WHERE trade_id IS NOT NULL
         """)
 
-        con.commit()
+        # Expire sweep: the partial index only holds open trades with a posted message,
+        # so the sweep costs O(open trades) however much history piles up
+        con.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_open
+        ON trades (created_at)
+        WHERE status IN ('pending','active') AND channel_id IS NOT NULL AND message_id IS NOT NULL
+        """)
 
-def get_config(guild_id: int):
+        # Trade history / stats per user (the OR is planned as a multi-index union)
+        con.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_opener
+        ON trades (guild_id, opener_id, created_at DESC)
+        """)
+        con.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_partner
+        ON trades (guild_id, partner_id, created_at DESC)
+        """)
+
+        # Leaderboard: walk a guild's totals in rank order instead of sorting them all
+        con.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vouch_totals_rank
+        ON vouch_totals (guild_id, total DESC)
+        """)
+
+    # Fresh planner stats so the indexes above are actually picked
     with db() as con:
-        row = con.execute("SELECT * FROM guild_config WHERE guild_id = ?", (guild_id,)).fetchone()
-        if row is None:
-            con.execute("INSERT INTO guild_config (guild_id) VALUES (?)", (guild_id,))
-            con.commit()
-            row = con.execute("SELECT * FROM guild_config WHERE guild_id = ?", (guild_id,)).fetchone()
-        return row
+        con.execute("ANALYZE")
+
+SQL_GET_OR_CREATE_CONFIG = (
+    "INSERT INTO guild_config (guild_id) VALUES (?) "
+    "ON CONFLICT(guild_id) DO UPDATE SET guild_id = excluded.guild_id RETURNING *"
+)
+
+# guild_config only changes through the admin commands (set_config_value),
+# so rows are cached per guild and dropped on write.
+_config_cache: dict[int, dict] = {}
+
+# Every config column with the value get_config() substitutes for NULL / 0
+_CONFIG_INT_DEFAULTS = {
+    "vouch_channel_id": 0, "trade_channel_id": 0, "report_receipts_channel_id": 0,
+    "role_new_id": 0, "role_verified_id": 0, "role_trusted_id": 0,
+    "thresh_new": 1, "thresh_verified": 5, "thresh_trusted": 15,
+}
+_CONFIG_COLS = frozenset(_CONFIG_INT_DEFAULTS)
+
+def get_config(guild_id: int) -> dict:
+    cfg = _config_cache.get(guild_id)
+    if cfg is not None:
+        return cfg
 
-def set_config_value(guild_id: int, key: str, value: int):
     with db() as con:
-        con.execute(f"UPDATE guild_config SET {key} = ? WHERE guild_id = ?", (value, guild_id))
-        con.commit()
+        # Creates the row on first use and returns it either way, in one statement
+        row = con.execute(SQL_GET_OR_CREATE_CONFIG, (guild_id,)).fetchone()
+
+        # Normalise once here so callers can use the ids/thresholds as plain ints.
+        # Cached under the DB lock, so a concurrent set_config_values can't land
+        # between the read and the cache write and leave this row stale.
+        cfg = dict(row)
+        for col, default in _CONFIG_INT_DEFAULTS.items():
+            cfg[col] = int(cfg[col] or default)
+        _config_cache[guild_id] = cfg
+    return cfg
+
+async def config_for(guild_id: int) -> dict:
+    """get_config() for async code: a cache hit skips the worker-thread hop."""
+    cfg = _config_cache.get(guild_id)
+    if cfg is None:
+        cfg = await run_db(get_config, guild_id)
+    return cfg
+
+# (sorted columns) -> upsert text, built once per combination: stable SQL for the
+# statement cache, and an unknown key is a KeyError instead of text spliced into SQL.
+# Upsert, so an admin command on a brand-new guild isn't a silent no-op.
+_set_config_sql: dict[tuple[str, ...], str] = {}
+
+def set_config_values(guild_id: int, **fields: int):
+    """Write several guild_config columns in one statement (one commit)."""
+    cols = tuple(sorted(fields))
+    sql = _set_config_sql.get(cols)
+    if sql is None:
+        bad = set(cols) - _CONFIG_COLS
+        if not cols or bad:
+            raise KeyError(f"set_config_values: not a config column: {', '.join(sorted(bad)) or '(none)'}")
+        sql = (
+            f"INSERT INTO guild_config (guild_id, {', '.join(cols)}) VALUES (?{', ?' * len(cols)}) "
+            f"ON CONFLICT(guild_id) DO UPDATE SET {', '.join(f'{k} = excluded.{k}' for k in cols)}"
+        )
+        _set_config_sql[cols] = sql
+    with db() as con:
+        con.execute(sql, (guild_id, *(fields[k] for k in cols)))
+    _config_cache.pop(guild_id, None)
+    _tiers_cache.pop(guild_id, None)
+    _tier_roles_cache.pop(guild_id, None)
+
+def set_config_value(guild_id: int, key: str, value: int):
+    set_config_values(guild_id, **{key: value})
 
 # -------------------- Profile helpers (Embark ID) --------------------
+# (guild_id, user_id) -> (embark_id, expires_at); set_embark_id refreshes its own entry
+EMBARK_CACHE_TTL = 300
+_embark_cache: dict[tuple[int, int], tuple[Optional[str], float]] = {}
+
 def set_embark_id(guild_id: int, user_id: int, embark_id: str):
     now = int(time.time())
     with db() as con:
@@ -214,14 +447,46 @@ def set_embark_id(guild_id: int, user_id: int, embark_id: str):
             (guild_id, user_id, embark_id, now)
         )
         con.commit()
+        _embark_cache[(guild_id, user_id)] = (embark_id or None, time.monotonic() + EMBARK_CACHE_TTL)
 
 def get_embark_id(guild_id: int, user_id: int) -> Optional[str]:
+    cached = _embark_cache.get((guild_id, user_id))
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
     with db() as con:
         row = con.execute(
             "SELECT embark_id FROM profiles WHERE guild_id=? AND user_id=?",
             (guild_id, user_id)
         ).fetchone()
-        return (row["embark_id"] if row and row["embark_id"] else None)
+        eid = row["embark_id"] if row and row["embark_id"] else None
+        _embark_cache[(guild_id, user_id)] = (eid, time.monotonic() + EMBARK_CACHE_TTL)
+    return eid
+
+def get_embark_ids(guild_id: int, user_ids: list[int]) -> dict[int, Optional[str]]:
+    """get_embark_id() for several users; cache misses are read in one query."""
+    now = time.monotonic()
+    out: dict[int, Optional[str]] = {}
+    missing = []
+    for uid in user_ids:
+        cached = _embark_cache.get((guild_id, uid))
+        if cached is not None and cached[1] > now:
+            out[uid] = cached[0]
+        else:
+            missing.append(uid)
+    if missing:
+        with db() as con:
+            rows = con.execute(
+                f"SELECT user_id, embark_id FROM profiles WHERE guild_id=? AND user_id IN ({','.join('?' * len(missing))})",
+                (guild_id, *missing)
+            ).fetchall()
+            found = {int(r["user_id"]): r["embark_id"] or None for r in rows}
+            expires_at = now + EMBARK_CACHE_TTL
+            for uid in missing:
+                out[uid] = found.get(uid)
+                _embark_cache[(guild_id, uid)] = (out[uid], expires_at)
+    return out
+
 # -------------------- Report DB helpers --------------------
 def create_report(
     guild_id: int,
@@ -271,81 +536,173 @@ def resolve_report(report_id: int, resolver_id: int):
         con.commit()
 
 # -------------------- Vouch DB helpers --------------------
-def add_vouch(guild_id: int, trade_id: str, target_id: int, voucher_id: int, stars: int,
-              note: Optional[str], proof_url: Optional[str]) -> None:
-    now = int(time.time())
-    with db() as con:
-        con.execute(
-            "INSERT INTO vouches (guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, created_at) VALUES (?,?,?,?,?,?,?,?)",
-            (guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, now)
-        )
-        con.commit()
+# Hot-path SQL kept as constants so every call hits the connection's statement cache
+# A repeat vouch for the same trade hits idx_one_vouch_per_trade_per_voucher and
+# returns no row (and fires no trigger) instead of raising
+SQL_ADD_VOUCH = (
+    "INSERT INTO vouches (guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, created_at) "
+    "VALUES (?,?,?,?,?,?,?,?) "
+    "ON CONFLICT(guild_id, trade_id, voucher_id) WHERE trade_id IS NOT NULL DO NOTHING RETURNING id"
+)
+# vouch_totals is maintained by trg_vouch_totals, so every read below is a primary-key lookup
+SQL_VOUCH_STATS = (
+    "SELECT total AS c, COALESCE(stars_sum * 1.0 / NULLIF(total, 0), 0.0) AS a "
+    "FROM vouch_totals WHERE guild_id = ? AND target_id = ?"
+)
 
+# (guild_id, target_id) -> (total, avg stars, expires_at); add_vouches refreshes the entries it changes
+VOUCH_STATS_TTL = 60
+_stats_cache: dict[tuple[int, int], tuple[int, float, float]] = {}
 
-def vouch_count(guild_id: int, target_id: int) -> int:
-    with db() as con:
-        row = con.execute(
-            "SELECT COUNT(*) AS c FROM vouches WHERE guild_id = ? AND target_id = ? AND trade_id IS NOT NULL",
-            (guild_id, target_id)
-        ).fetchone()
-        return int(row["c"])
+def _insert_vouch(con: sqlite3.Connection, now: int, guild_id: int, trade_id: str, target_id: int,
+                  voucher_id: int, stars: int, note: Optional[str], proof_url: Optional[str]) -> Optional[tuple[int, float]]:
+    inserted = con.execute(
+        SQL_ADD_VOUCH, (guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, now)
+    ).fetchone()
+    if inserted is None:
+        return None
+    row = con.execute(SQL_VOUCH_STATS, (guild_id, target_id)).fetchone()
+    return int(row["c"]), float(row["a"])
 
+def add_vouches(rows: list[tuple]) -> list[Optional[tuple[int, float]]]:
+    """Insert (guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, now)
+    rows in a single transaction.
+
+    Each insert, its vouch_totals bump (trigger) and the read-back share that
+    transaction, so the returned totals always include the vouch. Returns
+    (total, avg stars) per row, or None where the voucher already vouched for the trade.
+    """
+    with txn() as con:
+        results = [
+            _insert_vouch(con, now, guild_id, trade_id, target_id, voucher_id, stars, note, proof_url)
+            for guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, now in rows
+        ]
+
+        expires_at = time.monotonic() + VOUCH_STATS_TTL
+        for row, res in zip(rows, results):
+            if res:
+                _stats_cache[(row[0], row[2])] = (*res, expires_at)
+                _top_cache.pop(row[0], None)
+    return results
+
+
+def vouch_stats(guild_id: int, target_id: int) -> tuple[int, float]:
+    """(total, avg stars) for a trader from one vouch_totals row."""
+    cached = _stats_cache.get((guild_id, target_id))
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
 
-def avg_stars(guild_id: int, target_id: int) -> float:
     with db() as con:
-        row = con.execute(
-            "SELECT AVG(stars) AS a FROM vouches WHERE guild_id = ? AND target_id = ? AND trade_id IS NOT NULL",
-            (guild_id, target_id)
-        ).fetchone()
-        return float(row["a"] or 0.0)
+        row = con.execute(SQL_VOUCH_STATS, (guild_id, target_id)).fetchone()
+        total, avg = (int(row["c"]), float(row["a"])) if row else (0, 0.0)
+        _stats_cache[(guild_id, target_id)] = (total, avg, time.monotonic() + VOUCH_STATS_TTL)
+    return total, avg
 
 
+# guild_id -> (limit, rows, expires_at); any new vouch in the guild drops the entry
+TOP_TRADERS_TTL = 30
+_top_cache: dict[int, tuple[int, list[tuple[int, int, float]], float]] = {}
+
 def top_traders(guild_id: int, limit: int = 10):
+    cached = _top_cache.get(guild_id)
+    if cached and cached[0] == limit and cached[2] > time.monotonic():
+        return cached[1]
+
     with db() as con:
         rows = con.execute(
             """
-            SELECT target_id, COUNT(*) AS vouches, AVG(stars) AS avg_stars
-            FROM vouches
-            WHERE guild_id = ? AND trade_id IS NOT NULL
-            GROUP BY target_id
+            SELECT target_id, total AS vouches, stars_sum * 1.0 / total AS avg_stars
+            FROM vouch_totals
+            WHERE guild_id = ? AND total > 0
             ORDER BY vouches DESC, avg_stars DESC
             LIMIT ?
             """,
             (guild_id, limit)
         ).fetchall()
-        return [(int(r["target_id"]), int(r["vouches"]), float(r["avg_stars"] or 0.0)) for r in rows]
+        top = [(int(r["target_id"]), int(r["vouches"]), float(r["avg_stars"] or 0.0)) for r in rows]
+        _top_cache[guild_id] = (limit, top, time.monotonic() + TOP_TRADERS_TTL)
+    return top
+
+# -------------------- Vouch write batching --------------------
+# Vouches submitted while a write is in flight are flushed together in one
+# transaction (one commit) by a single writer task. A lone vouch is written
+# immediately — there is no batching delay.
+VOUCH_BATCH_MAX = 64
+_vouch_queue: Optional[asyncio.Queue] = None
+_vouch_writer_task: Optional[asyncio.Task] = None
+
+async def _vouch_writer():
+    while True:
+        batch = [await _vouch_queue.get()]
+        while len(batch) < VOUCH_BATCH_MAX and not _vouch_queue.empty():
+            batch.append(_vouch_queue.get_nowait())
+
+        try:
+            results = await run_db(add_vouches, [args for args, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+async def submit_vouch(guild_id: int, trade_id: str, target_id: int, voucher_id: int, stars: int,
+                       note: Optional[str], proof_url: Optional[str]) -> Optional[tuple[int, float]]:
+    """Write a vouch through the batching writer; the target's new (total, avg stars), or None for a duplicate vouch."""
+    global _vouch_queue, _vouch_writer_task
+    if _vouch_queue is None:
+        _vouch_queue = asyncio.Queue()
+    if _vouch_writer_task is None or _vouch_writer_task.done():
+        _vouch_writer_task = asyncio.create_task(_vouch_writer())
+
+    # Stamp the vouch when it was submitted, not when the batch happens to flush
+    now = int(time.time())
+    fut = asyncio.get_running_loop().create_future()
+    _vouch_queue.put_nowait(((guild_id, trade_id, target_id, voucher_id, stars, note, proof_url, now), fut))
+    return await fut
 
 # -------------------- Temp VC helpers --------------------
+# In-memory mirror of temp_vcs: (guild_id, channel_id) -> (owner_id, slot). Loaded once
+# at startup (load_temp_vcs) and kept in step by the writers below, so voice-state
+# events answer "is this a temp VC / who owns it" without touching SQLite.
+_temp_vcs: dict[tuple[int, int], tuple[Optional[int], Optional[int]]] = {}
 
-def add_temp_vc(guild_id: int, channel_id: int, owner_id: int):
+def load_temp_vcs():
+    with db() as con:
+        rows = con.execute("SELECT guild_id, channel_id, owner_id, slot FROM temp_vcs").fetchall()
+    _temp_vcs.clear()
+    for r in rows:
+        _temp_vcs[(int(r["guild_id"]), int(r["channel_id"]))] = (r["owner_id"], r["slot"])
+
+def next_temp_vc_slot(guild_id: int) -> int:
+    """Number for the next Auto VC name: one past the highest slot still tracked."""
+    return max((slot or 0 for (gid, _), (_, slot) in _temp_vcs.items() if gid == guild_id), default=0) + 1
+
+def add_temp_vc(guild_id: int, channel_id: int, owner_id: int, slot: Optional[int] = None):
     now = int(time.time())
     with db() as con:
         con.execute(
-            "INSERT OR REPLACE INTO temp_vcs (guild_id, channel_id, owner_id, created_at) VALUES (?,?,?,?)",
-            (guild_id, channel_id, owner_id, now)
+            "INSERT OR REPLACE INTO temp_vcs (guild_id, channel_id, owner_id, created_at, slot) VALUES (?,?,?,?,?)",
+            (guild_id, channel_id, owner_id, now, slot)
         )
         con.commit()
+        _temp_vcs[(guild_id, channel_id)] = (owner_id, slot)
 
 def remove_temp_vc(guild_id: int, channel_id: int):
     with db() as con:
         con.execute("DELETE FROM temp_vcs WHERE guild_id=? AND channel_id=?", (guild_id, channel_id))
         con.commit()
+        _temp_vcs.pop((guild_id, channel_id), None)
 
 def is_temp_vc(guild_id: int, channel_id: int) -> bool:
-    with db() as con:
-        row = con.execute(
-            "SELECT 1 FROM temp_vcs WHERE guild_id=? AND channel_id=?",
-            (guild_id, channel_id)
-        ).fetchone()
-        return row is not None
+    return (guild_id, channel_id) in _temp_vcs
 
 def get_temp_vc_owner(guild_id: int, channel_id: int) -> Optional[int]:
-    with db() as con:
-        row = con.execute(
-            "SELECT owner_id FROM temp_vcs WHERE guild_id=? AND channel_id=?",
-            (guild_id, channel_id)
-        ).fetchone()
-        return int(row["owner_id"]) if row and row["owner_id"] is not None else None
+    entry = _temp_vcs.get((guild_id, channel_id))
+    return int(entry[0]) if entry and entry[0] is not None else None
 
 def set_temp_vc_owner(guild_id: int, channel_id: int, owner_id: int):
     with db() as con:
@@ -354,21 +711,48 @@ def set_temp_vc_owner(guild_id: int, channel_id: int, owner_id: int):
             (owner_id, guild_id, channel_id)
         )
         con.commit()
+        entry = _temp_vcs.get((guild_id, channel_id))
+        if entry:
+            _temp_vcs[(guild_id, channel_id)] = (owner_id, entry[1])
 
 # -------------------- Trade DB helpers --------------------
+# trade_id -> row, oldest first. Writes that return the new row (RETURNING *)
+# store it; set_trade_message / the expire sweep just drop the entry.
+# Button handlers re-read the same trade several times per click.
+TRADE_CACHE_MAX = 512
+_trade_cache: dict[str, sqlite3.Row] = {}
+
+def _remember_trade(trade: sqlite3.Row):
+    # Callers hold the DB lock: helpers also run on worker threads (run_db)
+    if trade["trade_id"] not in _trade_cache and len(_trade_cache) >= TRADE_CACHE_MAX:
+        _trade_cache.pop(next(iter(_trade_cache)), None)
+    _trade_cache[trade["trade_id"]] = trade
+
+TRADE_ID_ATTEMPTS = 5
+
 def make_trade_id() -> str:
-    return "T-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    # 6 base32 chars (A-Z, 2-7) from one urandom call; upper-case only, since
+    # IDs are read back with .upper()
+    return "T-" + base64.b32encode(os.urandom(5))[:6].decode()
 
 def create_trade(guild_id: int, opener_id: int, partner_id: int) -> str:
-    trade_id = make_trade_id()
     now = int(time.time())
-    with db() as con:
-        con.execute(
-            "INSERT INTO trades (trade_id, guild_id, opener_id, partner_id, status, created_at) VALUES (?,?,?,?,?,?)",
-            (trade_id, guild_id, opener_id, partner_id, "pending", now)
-        )
-        con.commit()
-    return trade_id
+    # trade_id is the primary key, so a collision fails the INSERT instead of
+    # silently sharing an ID; draw a fresh one and retry
+    for attempt in range(TRADE_ID_ATTEMPTS):
+        trade_id = make_trade_id()
+        try:
+            with db() as con:
+                trade = con.execute(
+                    "INSERT INTO trades (trade_id, guild_id, opener_id, partner_id, status, created_at) "
+                    "VALUES (?,?,?,?,?,?) RETURNING *",
+                    (trade_id, guild_id, opener_id, partner_id, "pending", now)
+                ).fetchone()
+                _remember_trade(trade)
+            return trade_id
+        except sqlite3.IntegrityError:
+            if attempt == TRADE_ID_ATTEMPTS - 1:
+                raise
 
 def set_trade_message(trade_id: str, channel_id: int, message_id: int):
     with db() as con:
@@ -377,79 +761,165 @@ def set_trade_message(trade_id: str, channel_id: int, message_id: int):
             (channel_id, message_id, trade_id)
         )
         con.commit()
+    _trade_cache.pop(trade_id, None)
+
+SQL_GET_TRADE = "SELECT * FROM trades WHERE trade_id=?"
 
 def get_trade(trade_id: str):
-    with db() as con:
-        return con.execute("SELECT * FROM trades WHERE trade_id=?", (trade_id,)).fetchone()
+    trade = _trade_cache.get(trade_id)
+    if trade is not None:
+        return trade
 
-def update_trade(trade_id: str, **fields):
+    with db() as con:
+        trade = con.execute(SQL_GET_TRADE, (trade_id,)).fetchone()
+        if trade is not None:
+            _remember_trade(trade)
+    return trade
+
+_TRADE_UPDATE_COLS = frozenset({
+    "status", "accepted", "opener_confirmed", "partner_confirmed", "channel_id", "message_id",
+})
+# (sorted columns, guarded) -> UPDATE text; the handful of combinations used are
+# built once, and keyword order doesn't produce a second statement for the same set
+_update_trade_sql: dict[tuple[tuple[str, ...], bool], str] = {}
+
+def update_trade(trade_id: str, expect_status: Optional[str] = None, **fields) -> Optional[sqlite3.Row]:
+    """Apply the column changes; returns the updated row (None if no such trade).
+
+    With expect_status the UPDATE only applies while the trade is still in that
+    status (compare-and-swap), so None also means someone else moved it first.
+    """
     if not fields:
-        return
-    keys = ", ".join([f"{k}=?" for k in fields.keys()])
-    vals = list(fields.values())
+        return get_trade(trade_id)
+    cols = tuple(sorted(fields))
+    key = (cols, expect_status is not None)
+    sql = _update_trade_sql.get(key)
+    if sql is None:
+        bad = set(cols) - _TRADE_UPDATE_COLS
+        if bad:
+            raise KeyError(f"update_trade: not an updatable column: {', '.join(sorted(bad))}")
+        sql = f"UPDATE trades SET {', '.join(f'{k}=?' for k in cols)} WHERE trade_id=?"
+        if expect_status is not None:
+            sql += " AND status=?"
+        sql += " RETURNING *"
+        _update_trade_sql[key] = sql
+    params = (*(fields[k] for k in cols), trade_id)
+    if expect_status is not None:
+        params += (expect_status,)
     with db() as con:
-        con.execute(f"UPDATE trades SET {keys} WHERE trade_id=?", (*vals, trade_id))
-        con.commit()
+        trade = con.execute(sql, params).fetchone()
+        if trade is None:
+            _trade_cache.pop(trade_id, None)
+        else:
+            _remember_trade(trade)
+    return trade
+
+# Setting one side's flag completes the trade if the other side already confirmed.
+# One statement, so two near-simultaneous confirms can't both miss each other.
+_CONFIRM_TRADE_SQL = {
+    side: f"""
+    UPDATE trades
+    SET {side}=1, status = CASE WHEN {other}=1 THEN 'completed' ELSE status END
+    WHERE trade_id=? AND status='active'
+    RETURNING *
+    """
+    for side, other in (("opener_confirmed", "partner_confirmed"), ("partner_confirmed", "opener_confirmed"))
+}
+
+def confirm_trade(trade_id: str, side: str) -> Optional[sqlite3.Row]:
+    """Record one side's confirmation; returns the updated row, or None if the trade is no longer active."""
+    with db() as con:
+        trade = con.execute(_CONFIRM_TRADE_SQL[side], (trade_id,)).fetchone()
+        if trade is None:
+            _trade_cache.pop(trade_id, None)
+        else:
+            _remember_trade(trade)
+    return trade
 
-def find_expirable_trades(now_ts: int) -> List[sqlite3.Row]:
+def expire_stale_trades(now_ts: int) -> List[sqlite3.Row]:
+    """Mark every overdue pending/active trade expired in one statement; returns the rows it
+    changed, with just the columns the expire loop and build_trade_embed() read."""
     cutoff = now_ts - TRADE_EXPIRE_SECONDS
     with db() as con:
         rows = con.execute(
             """
-            SELECT * FROM trades
+            UPDATE trades SET status='expired'
             WHERE status IN ('pending','active')
               AND created_at <= ?
               AND channel_id IS NOT NULL
               AND message_id IS NOT NULL
+            RETURNING trade_id, guild_id, channel_id, message_id,
+                      opener_id, partner_id, status, opener_confirmed, partner_confirmed
             """,
             (cutoff,)
         ).fetchall()
-        return rows
+    for row in rows:
+        _trade_cache.pop(row["trade_id"], None)
+    return rows
+
+# As opener and as partner, each side read newest-first from its own index and cut at
+# :n, so only 2*:n rows get merged. A plain OR sorts every trade the user ever had.
+SQL_LAST_TRADES = """
+    SELECT *, strftime('%Y-%m-%d', created_at, 'unixepoch', 'localtime') AS date_txt
+    FROM (
+        SELECT * FROM (
+            SELECT trade_id, status, created_at, opener_id, partner_id FROM trades
+            WHERE guild_id = :g AND opener_id = :u
+            ORDER BY created_at DESC LIMIT :n
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT trade_id, status, created_at, opener_id, partner_id FROM trades
+            WHERE guild_id = :g AND partner_id = :u AND opener_id != :u
+            ORDER BY created_at DESC LIMIT :n
+        )
+        ORDER BY created_at DESC
+        LIMIT :n
+    )
+"""
 
 def last_trades_for_user(guild_id: int, user_id: int, limit: int = 5) -> List[sqlite3.Row]:
     with db() as con:
-        rows = con.execute(
-            """
-            SELECT trade_id, status, created_at, opener_id, partner_id
-            FROM trades
-            WHERE guild_id = ?
-              AND (opener_id = ? OR partner_id = ?)
-            ORDER BY created_at DESC
-            LIMIT ?
-            """,
-            (guild_id, user_id, user_id, limit)
-        ).fetchall()
-        return rows
-def trade_stats_for_user(guild_id: int, user_id: int):
+        return con.execute(SQL_LAST_TRADES, {"g": guild_id, "u": user_id, "n": limit}).fetchall()
+
+def get_user_summary(guild_id: int, user_id: int, recent: int = 0) -> dict:
+    """Vouch totals, trade counts and Embark ID for /stats in one statement.
+
+    With recent > 0 the last `recent` trades come back under "recent", read on
+    the same worker hop and lock hold.
+    """
     with db() as con:
-        rows = con.execute(
+        row = con.execute(
             """
-            SELECT status, COUNT(*) AS c
+            SELECT
+                COUNT(*) AS total,
+                COALESCE(SUM(status = 'completed'), 0) AS completed,
+                COALESCE(SUM(status IN ('cancelled','expired','declined')), 0) AS failed,
+                (SELECT total FROM vouch_totals WHERE guild_id = :g AND target_id = :u) AS vouches,
+                (SELECT stars_sum * 1.0 / NULLIF(total, 0) FROM vouch_totals
+                 WHERE guild_id = :g AND target_id = :u) AS avg_stars,
+                (SELECT embark_id FROM profiles WHERE guild_id = :g AND user_id = :u) AS embark_id
             FROM trades
-            WHERE guild_id = ?
-              AND (opener_id = ? OR partner_id = ?)
-            GROUP BY status
+            WHERE guild_id = :g
+              AND (opener_id = :u OR partner_id = :u)
             """,
-            (guild_id, user_id, user_id)
-        ).fetchall()
+            {"g": guild_id, "u": user_id}
+        ).fetchone()
+        recent_rows = (
+            con.execute(SQL_LAST_TRADES, {"g": guild_id, "u": user_id, "n": recent}).fetchall()
+            if recent > 0 else []
+        )
 
-    stats = {
-        "total": 0,
-        "completed": 0,
-        "failed": 0
+    return {
+        "recent": recent_rows,
+        "vouches": int(row["vouches"] or 0),
+        "avg_stars": float(row["avg_stars"] or 0.0),
+        "total": int(row["total"]),
+        "completed": int(row["completed"]),
+        "failed": int(row["failed"]),
+        "embark_id": row["embark_id"] or None,
     }
 
-    for r in rows:
-        count = int(r["c"])
-        stats["total"] += count
-        status = str(r["status"])
-        if status == "completed":
-            stats["completed"] += count
-        elif status in ("cancelled", "expired", "declined"):
-            stats["failed"] += count
-
-    return stats
-
 # -------------------- Role logic --------------------
 @dataclass
 class Tier:
@@ -457,45 +927,102 @@ class Tier:
     threshold: int
     role_id: Optional[int]
 
-def get_tiers(cfg) -> list[Tier]:
-    return [
-        Tier("Trusted Trader", int(cfg["thresh_trusted"] or 15), int(cfg["role_trusted_id"] or 0) or None),
-        Tier("Verified Trader", int(cfg["thresh_verified"] or 5), int(cfg["role_verified_id"] or 0) or None),
-        Tier("New Trader", int(cfg["thresh_new"] or 1), int(cfg["role_new_id"] or 0) or None),
-    ]
+# Built once per guild config; set_config_value drops the entry.
+# Value: (thresholds ascending, tiers in the same order) for bisect lookups.
+_tiers_cache: dict[int, tuple[list[int], list[Tier]]] = {}
+
+def get_tiers(cfg) -> tuple[list[int], list[Tier]]:
+    cached = _tiers_cache.get(cfg["guild_id"])
+    if cached is None:
+        tiers = [
+            Tier("New Trader", cfg["thresh_new"], cfg["role_new_id"] or None),
+            Tier("Verified Trader", cfg["thresh_verified"], cfg["role_verified_id"] or None),
+            Tier("Trusted Trader", cfg["thresh_trusted"], cfg["role_trusted_id"] or None),
+        ]
+        # Stable sort: on equal thresholds the higher tier stays last, so bisect picks it
+        tiers.sort(key=lambda t: t.threshold)
+        cached = ([t.threshold for t in tiers], tiers)
+        _tiers_cache[cfg["guild_id"]] = cached
+    return cached
+
+def tier_index(cfg, total_vouches: int) -> int:
+    """Index into get_tiers()[1] of the highest tier reached, or -1."""
+    thresholds, _ = get_tiers(cfg)
+    return bisect.bisect_right(thresholds, total_vouches) - 1
+
+# guild_id -> mod/trial-mod ping for new report channels (None if neither role
+# exists). Mentions only depend on the role ids, so only a delete invalidates.
+_report_ping_cache: dict[int, Optional[str]] = {}
+
+# guild_id -> {role_id: Role} for the configured tier roles. Dropped when the
+# config changes (set_config_value) or a role is edited/deleted in the guild.
+_tier_roles_cache: dict[int, dict[int, discord.Role]] = {}
+
+def get_tier_roles(guild: discord.Guild, cfg) -> dict[int, discord.Role]:
+    roles = _tier_roles_cache.get(guild.id)
+    if roles is None:
+        roles = {}
+        for cfg_key in ("role_new_id", "role_verified_id", "role_trusted_id"):
+            rid = cfg[cfg_key]
+            role = guild.get_role(rid) if rid else None
+            if role:
+                roles[rid] = role
+        _tier_roles_cache[guild.id] = roles
+    return roles
 
-async def apply_roles(member: discord.Member, total_vouches: int) -> Optional[str]:
-    cfg = get_config(member.guild.id)
-    tiers = get_tiers(cfg)
-
-    chosen: Optional[Tier] = None
-    for t in tiers:
-        if total_vouches >= t.threshold and t.role_id:
-            chosen = t
-            break
-
-    role_new = member.guild.get_role(int(cfg["role_new_id"] or 0)) if cfg["role_new_id"] else None
-    role_ver = member.guild.get_role(int(cfg["role_verified_id"] or 0)) if cfg["role_verified_id"] else None
-    role_tru = member.guild.get_role(int(cfg["role_trusted_id"] or 0)) if cfg["role_trusted_id"] else None
-    roles_all = [r for r in [role_new, role_ver, role_tru] if r]
-
-    to_remove = [r for r in roles_all if r in member.roles]
-    if to_remove:
-        await member.remove_roles(*to_remove, reason="Vouch tier update")
-
-    if chosen and chosen.role_id:
-        role = member.guild.get_role(chosen.role_id)
-        if role:
-            await member.add_roles(role, reason="Vouch tier update")
-            return chosen.name
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    _tier_roles_cache.pop(after.guild.id, None)
 
-    return None
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    _tier_roles_cache.pop(role.guild.id, None)
+    _report_ping_cache.pop(role.guild.id, None)
+
+async def _edit_tier_roles(member: discord.Member, remove: list[discord.Role], add: list[discord.Role]):
+    # Per-role endpoints, not member.edit(roles=...): without the members intent the
+    # cached member.roles can be stale, and a full-list PATCH would clobber other roles
+    if remove:
+        await member.remove_roles(*remove, reason="Vouch tier update")
+    if add:
+        await member.add_roles(*add, reason="Vouch tier update")
+
+async def apply_roles(member: discord.Member, total_vouches: int) -> Optional[str]:
+    """Work out the member's tier and return its name; the role edits themselves
+    (REST calls) run in the background so the vouch reply doesn't wait on them."""
+    cfg = await config_for(member.guild.id)
+    tier_roles = get_tier_roles(member.guild, cfg)
+    if not tier_roles:
+        return None  # no tier roles configured (or none still exist)
+
+    # Highest reached tier that actually has a role configured
+    _, tiers = get_tiers(cfg)
+    idx = tier_index(cfg, total_vouches)
+    while idx >= 0 and not tiers[idx].role_id:
+        idx -= 1
+    chosen: Optional[Tier] = tiers[idx] if idx >= 0 else None
+
+    # Only touch what differs; an unchanged tier costs zero REST calls
+    desired = {chosen.role_id} if chosen and chosen.role_id in tier_roles else set()
+    current = {r.id for r in member.roles} & tier_roles.keys()
+
+    to_remove = [tier_roles[rid] for rid in current - desired]
+    to_add = [tier_roles[rid] for rid in desired - current]
+    if to_remove or to_add:
+        spawn(_edit_tier_roles(member, to_remove, to_add), f"tier roles for {member.id}")
+
+    return chosen.name if desired else None
 
 # -------------------- Role display helpers --------------------
 REGION_ROLE_NAMES = ["🌎NA", "🌎EU", "🌎OCE", "🌎Asia", "🌎SA"]
 PLATFORM_ROLE_NAMES = ["🎮Console", "🖥️PC"]
 PLAYSTYLE_ROLE_NAMES = ["🟢 Casual", "🔴 Sweaty", "💰Traders", "🧠 Helper"]
 STAFF_ROLE_NAMES = ["🔨 Mods", "🧪 Trial Mods"]
+TIER_FALLBACK_LABELS = {
+    "Trusted Trader": "🛡️ Trusted Trader",
+    "Verified Trader": "🪙 Verified Trader",
+    "New Trader": "🆕 New Trader",
+}
 
 def _has_role_name(member: discord.Member, role_name: str) -> bool:
     return any(r.name == role_name for r in member.roles)
@@ -513,23 +1040,17 @@ def trader_tier_label(member: Optional[discord.Member], total_vouches: int, cfg)
     # Prefer the actual tier roles on the member (most accurate)
     if member:
         for cfg_key in ("role_trusted_id", "role_verified_id", "role_new_id"):
-            rid = int(cfg[cfg_key] or 0)
-            if rid and any(r.id == rid for r in member.roles):
-                role = member.guild.get_role(rid)
-                return role.name if role else "Trader Tier"
+            rid = cfg[cfg_key]
+            # Member.get_role is a lookup in the member's sorted role ids, no scan of member.roles
+            role = member.get_role(rid) if rid else None
+            if role:
+                return role.name
 
     # Fallback: compute from thresholds (in case roles weren't applied yet)
-    thresh_new = int(cfg["thresh_new"] or 1)
-    thresh_ver = int(cfg["thresh_verified"] or 5)
-    thresh_tru = int(cfg["thresh_trusted"] or 15)
-
-    if total_vouches >= thresh_tru:
-        return "🛡️ Trusted Trader"
-    if total_vouches >= thresh_ver:
-        return "🪙 Verified Trader"
-    if total_vouches >= thresh_new:
-        return "🆕 New Trader"
-    return "Unranked"
+    idx = tier_index(cfg, total_vouches)
+    if idx < 0:
+        return "Unranked"
+    return TIER_FALLBACK_LABELS[get_tiers(cfg)[1][idx].name]
 
 def user_badges(member: Optional[discord.Member]) -> dict:
     if not member:
@@ -542,81 +1063,136 @@ def user_badges(member: Optional[discord.Member]) -> dict:
 
     return {"region": region, "platform": platform, "playstyle": playstyle, "staff": staff}
 
+def trader_profile(user: discord.abc.User, total_vouches: int, cfg) -> tuple[str, dict]:
+    """(tier label, badges) for /rep and /stats; a non-Member user gets the fallbacks."""
+    member = user if isinstance(user, discord.Member) else None
+    return trader_tier_label(member, total_vouches, cfg), user_badges(member)
+
 
 # -------------------- Auto-VC helpers --------------------
-def next_temp_vc_name(guild: discord.Guild) -> str:
-    """Find next available '⫷┃𝚂𝚀𝚄𝙰𝙳 𝚅𝙲 N 🎙️' name by scanning existing voice channels."""
+def temp_vc_name(slot: int) -> str:
     # Example: ⫷┃𝚂𝚀𝚄𝙰𝙳 𝚅𝙲 1 🎙️
-    pattern = re.compile(rf"^{re.escape(TEMP_VC_PREFIX)}\s+(\d+)\s+{re.escape(TEMP_VC_SUFFIX)}$", re.IGNORECASE)
-    max_n = 0
-    for ch in guild.voice_channels:
-        m = pattern.match(ch.name or "")
+    return f"{TEMP_VC_PREFIX} {slot} {TEMP_VC_SUFFIX}"
+
+# -------------------- Member lookup --------------------
+async def prefetch_members(guild: discord.Guild, user_ids) -> dict[int, discord.Member]:
+    """Members for user_ids: cache hits first, then one gateway query for the rest
+    (the bot runs without the members intent, so the cache is partial)."""
+    found: dict[int, discord.Member] = {}
+    missing: list[int] = []
+    for uid in user_ids:
+        m = guild.get_member(uid)
         if m:
-            try:
-                max_n = max(max_n, int(m.group(1)))
-            except Exception:
-                pass
-    return f"{TEMP_VC_PREFIX} {max_n + 1} {TEMP_VC_SUFFIX}"
+            found[uid] = m
+        else:
+            missing.append(uid)
+
+    if missing:
+        try:
+            for m in await guild.query_members(user_ids=missing[:100], cache=True):
+                found[m.id] = m
+        except (discord.ClientException, asyncio.TimeoutError) as e:
+            logging.warning(f"query_members failed for {len(missing)} ids: {e}")
+    return found
+
 # -------------------- Embeds --------------------
-def build_trade_embed(guild: discord.Guild, trade_id: str) -> discord.Embed:
-    trade = get_trade(trade_id)
-    opener = guild.get_member(int(trade["opener_id"])) if trade else None
-    partner = guild.get_member(int(trade["partner_id"])) if trade else None
+_TRADE_TITLES = {
+    "pending": "🧾 Trade Request",
+    "active": "🤝 Trade Active",
+    "completed": "✅ Trade Completed",
+    "declined": "❌ Trade Declined",
+    "expired": "⏳ Trade Expired",
+    "cancelled": "🚫 Trade Cancelled",
+}
+
+# status -> (Status field text, footer text or None)
+_TRADE_STATUS_TEXT = {
+    "pending": (
+        "Waiting for partner to accept, decline, or for opener to cancel.",
+        "Partner: Accept/Decline • Opener: Cancel • Auto-expires in 3 hours",
+    ),
+    "active": (
+        "Active — complete the trade then both confirm.",
+        "Record/clip the trade if possible — clip proof may be required for mod action • Auto-expires in 3 hours",
+    ),
+    "completed": (
+        "Completed ✅ — you may now vouch using this Trade ID or the button below.",
+        "Tip: use the Leave Vouch button • /vouch still works too",
+    ),
+    "declined": ("Declined ❌", None),
+    "expired": ("Expired ⏳ — not completed within 3 hours.", None),
+    "cancelled": ("Cancelled 🚫", None),
+}
+
+# _STAR_LINES[stars] for 0..5
+_STAR_LINES = tuple("⭐" * n + "☆" * (5 - n) for n in range(6))
+
+def build_trade_embed(
+    guild: discord.Guild,
+    trade: sqlite3.Row,
+    eids: dict[int, Optional[str]],
+    opener: Optional[discord.Member] = None,
+    partner: Optional[discord.Member] = None
+) -> discord.Embed:
+    # Handlers pass the row they already hold and whichever member they already have
+    # (usually interaction.user); anyone missing is looked up in the member cache.
+    # Runs on the event loop (discord.py state isn't thread-safe); eids comes from
+    # get_embark_ids, fetched beforehand through run_db — see trade_embed().
+    trade_id = trade["trade_id"]
+    opener = opener or guild.get_member(int(trade["opener_id"]))
+    partner = partner or guild.get_member(int(trade["partner_id"]))
 
     status = trade["status"]
     oc = bool(trade["opener_confirmed"])
     pc = bool(trade["partner_confirmed"])
 
-    title_map = {
-        "pending": "🧾 Trade Request",
-        "active": "🤝 Trade Active",
-        "completed": "✅ Trade Completed",
-        "declined": "❌ Trade Declined",
-        "expired": "⏳ Trade Expired",
-        "cancelled": "🚫 Trade Cancelled",
-    }
-
-    embed = discord.Embed(title=title_map.get(status, "Trade"), color=discord.Color.blurple())
+    embed = discord.Embed(title=_TRADE_TITLES.get(status, "Trade"), color=discord.Color.blurple())
     embed.add_field(name="Trade ID", value=f"`{trade_id}`", inline=False)
     embed.add_field(name="Opener", value=opener.mention if opener else f"<@{trade['opener_id']}>", inline=True)
     embed.add_field(name="Partner", value=partner.mention if partner else f"<@{trade['partner_id']}>", inline=True)
 
-    opener_eid = get_embark_id(guild.id, int(trade["opener_id"])) if trade else None
-    partner_eid = get_embark_id(guild.id, int(trade["partner_id"])) if trade else None
+    opener_eid = eids[int(trade["opener_id"])]
+    partner_eid = eids[int(trade["partner_id"])]
     embed.add_field(name="Opener Embark ID", value=f"`{opener_eid}`" if opener_eid else "*Not set*", inline=True)
     embed.add_field(name="Partner Embark ID", value=f"`{partner_eid}`" if partner_eid else "*Not set*", inline=True)
 
-    if status == "pending":
-        embed.add_field(name="Status", value="Waiting for partner to accept, decline, or for opener to cancel.", inline=False)
-        embed.set_footer(text="Partner: Accept/Decline • Opener: Cancel • Auto-expires in 3 hours")
-    elif status == "active":
-        embed.add_field(name="Status", value="Active — complete the trade then both confirm.", inline=False)
+    status_text, footer = _TRADE_STATUS_TEXT.get(status, (None, None))
+    if status_text:
+        embed.add_field(name="Status", value=status_text, inline=False)
+    if status == "active":
         embed.add_field(
             name="Confirmations",
             value=f"Opener: {'✅' if oc else '⏳'} • Partner: {'✅' if pc else '⏳'}",
             inline=False
         )
-        embed.set_footer(text="Record/clip the trade if possible — clip proof may be required for mod action • Auto-expires in 3 hours")
-    elif status == "completed":
-        embed.add_field(name="Status", value="Completed ✅ — you may now vouch using this Trade ID or the button below.", inline=False)
-        embed.set_footer(text="Tip: use the Leave Vouch button • /vouch still works too")
-    elif status == "declined":
-        embed.add_field(name="Status", value="Declined ❌", inline=False)
-    elif status == "expired":
-        embed.add_field(name="Status", value="Expired ⏳ — not completed within 3 hours.", inline=False)
-    elif status == "cancelled":
-        embed.add_field(name="Status", value="Cancelled 🚫", inline=False)
+    if footer:
+        embed.set_footer(text=footer)
 
     if partner:
         embed.set_thumbnail(url=partner.display_avatar.url)
 
     return embed
 
-def build_vouch_embed(
+async def trade_embed(
     guild: discord.Guild,
+    trade: sqlite3.Row,
+    opener: Optional[discord.Member] = None,
+    partner: Optional[discord.Member] = None
+) -> discord.Embed:
+    """build_trade_embed() with both Embark IDs read off the event loop first."""
+    eids = await run_db(get_embark_ids, guild.id, [int(trade["opener_id"]), int(trade["partner_id"])])
+    return build_trade_embed(guild, trade, eids, opener, partner)
+
+# Static parts of every vouch-log embed; build_vouch_embed copies and fills it
+_VOUCH_EMBED_TEMPLATE = discord.Embed(title="✅ Vouch Logged", color=discord.Color.green())
+_VOUCH_EMBED_TEMPLATE.set_footer(text="Use /rep privately • Trade at your own risk")
+
+def build_vouch_embed(
     trade_id: str,
-    trader: discord.Member,
-    voucher: discord.Member,
+    trader_mention: str,
+    trader_avatar_url: str,
+    trader_eid: Optional[str],
+    voucher_mention: str,
     stars: int,
     total: int,
     avg: float,
@@ -624,20 +1200,14 @@ def build_vouch_embed(
     note: Optional[str],
     proof_url: Optional[str]
 ) -> discord.Embed:
-    star_line = "⭐" * stars + "☆" * (5 - stars)
-
-    embed = discord.Embed(
-        title="✅ Vouch Logged",
-        description=f"{star_line}  **({stars}/5)**",
-        color=discord.Color.green()
-    )
+    embed = _VOUCH_EMBED_TEMPLATE.copy()
+    embed.description = f"{_STAR_LINES[stars]}  **({stars}/5)**"
     embed.add_field(name="Trade ID", value=f"`{trade_id}`", inline=False)
 
-    trader_eid = get_embark_id(guild.id, trader.id)
-    embed.add_field(name="Trader", value=trader.mention, inline=True)
+    embed.add_field(name="Trader", value=trader_mention, inline=True)
     embed.add_field(name="Embark ID", value=f"`{trader_eid}`" if trader_eid else "*Not set*", inline=True)
 
-    embed.add_field(name="Vouched By", value=voucher.mention, inline=True)
+    embed.add_field(name="Vouched By", value=voucher_mention, inline=True)
     embed.add_field(name="Total Vouches", value=str(total), inline=True)
     embed.add_field(name="Avg Rating", value=f"**{avg:.2f}/5**", inline=True)
 
@@ -649,10 +1219,15 @@ def build_vouch_embed(
     if proof_url:
         embed.add_field(name="Proof", value=proof_url[:1024], inline=False)
 
-    embed.set_thumbnail(url=trader.display_avatar.url)
-    embed.set_footer(text="Use /rep privately • Trade at your own risk")
+    embed.set_thumbnail(url=trader_avatar_url)
     return embed
 
+def trade_line(guild: discord.Guild, user_id: int, r: sqlite3.Row) -> str:
+    other_id = int(r["partner_id"]) if user_id == int(r["opener_id"]) else int(r["opener_id"])
+    other = guild.get_member(other_id)
+    other_txt = other.mention if other else f"<@{other_id}>"
+    return f"`{r['trade_id']}` • **{str(r['status']).title()}** • with {other_txt}"
+
 # -------------------- Trade ID extraction (fixes Railway restart issues) --------------------
 def trade_id_from_message(interaction: discord.Interaction) -> Optional[str]:
     if not interaction.message or not interaction.message.embeds:
@@ -671,15 +1246,68 @@ def trade_id_from_message(interaction: discord.Interaction) -> Optional[str]:
 
 
 # -------------------- Reports UI --------------------
+_TRADE_ACTORS = {
+    "opener": ("opener_id",),
+    "partner": ("partner_id",),
+    "participant": ("opener_id", "partner_id"),
+}
+
+def requires_trade(status: str, status_msg: str, actor: Optional[str] = None, actor_msg: str = ""):
+    """Trade button guard: reads the Trade ID off the message, loads the row once, checks
+    its status and (optionally) who clicked, then calls fn(self, interaction, button, trade).
+    Any failed check answers ephemerally and stops there."""
+    actor_cols = _TRADE_ACTORS[actor] if actor else ()
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, interaction: discord.Interaction, button: discord.ui.Button):
+            trade_id = trade_id_from_message(interaction)
+            if not trade_id:
+                return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
+
+            trade = await run_db(get_trade, trade_id)
+            if not trade:
+                return await interaction.response.send_message("Trade not found.", ephemeral=True)
+            if trade["status"] != status:
+                return await interaction.response.send_message(status_msg, ephemeral=True)
+            if actor_cols and interaction.user.id not in {int(trade[c]) for c in actor_cols}:
+                return await interaction.response.send_message(actor_msg, ephemeral=True)
+
+            return await fn(self, interaction, button, trade)
+        return wrapper
+    return decorator
+
+# topic format: "report_id=123 trade_id=T-ABC123"
+_REPORT_ID_RE = re.compile(r"report_id=(\d+)")
+
 def _parse_report_id_from_channel(channel: discord.abc.GuildChannel) -> Optional[int]:
-    # topic format: "report_id=123 trade_id=T-ABC123"
     try:
         topic = getattr(channel, "topic", None) or ""
-        m = re.search(r"report_id=(\d+)", topic)
+        m = _REPORT_ID_RE.search(topic)
         return int(m.group(1)) if m else None
     except Exception:
         return None
 
+# Report channel permissions; the same overwrite object is shared by every target it applies to
+REPORT_HIDDEN_OVERWRITE = discord.PermissionOverwrite(view_channel=False)
+REPORT_BOT_OVERWRITE = discord.PermissionOverwrite(
+    view_channel=True,
+    send_messages=True,
+    read_message_history=True,
+    manage_channels=True,
+    manage_messages=True,
+)
+REPORT_PARTICIPANT_OVERWRITE = discord.PermissionOverwrite(
+    view_channel=True,
+    send_messages=True,
+    read_message_history=True,
+    attach_files=True,
+    embed_links=True,
+)
+REPORT_MOD_OVERWRITE = discord.PermissionOverwrite(
+    view_channel=True, send_messages=True, read_message_history=True, manage_messages=True
+)
+
 class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
     def __init__(self, trade_id: str):
         super().__init__(timeout=None)
@@ -713,7 +1341,7 @@ class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
 
     async def on_submit(self, interaction: discord.Interaction):
         trade_id = self.trade_id.strip().upper()
-        trade = get_trade(trade_id)
+        trade = await run_db(get_trade, trade_id)
         if not trade:
             return await interaction.response.send_message("Trade not found.", ephemeral=True)
 
@@ -737,7 +1365,8 @@ class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
         details = str(self.trade_details.value).strip() if self.trade_details.value else None
         proof = str(self.proof_url.value).strip() if self.proof_url.value else None
 
-        report_id = create_report(
+        report_id = await run_db(
+            create_report,
             guild_id=guild.id,
             trade_id=trade_id,
             reporter_id=reporter_id,
@@ -753,14 +1382,8 @@ class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
         if category and not isinstance(category, discord.CategoryChannel):
             category = None
 
-        # Create a unique channel name
-        base_name = f"report-{trade_id.lower()}"
-        name = base_name
-        existing_names = {c.name for c in guild.text_channels}
-        n = 2
-        while name in existing_names:
-            name = f"{base_name}-{n}"
-            n += 1
+        # report_id is unique already, so no need to check existing channel names
+        name = f"report-{trade_id.lower()}-{report_id}"
 
         # Overwrites
         async def _get_member(uid: int) -> Optional[discord.Member]:
@@ -774,39 +1397,27 @@ class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
 
         me = guild.me or (guild.get_member(bot.user.id) if bot.user else None)
 
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        }
+        overwrites = {guild.default_role: REPORT_HIDDEN_OVERWRITE}
         if me:
-            overwrites[me] = discord.PermissionOverwrite(
-                view_channel=True,
-                send_messages=True,
-                read_message_history=True,
-                manage_channels=True,
-                manage_messages=True,
-            )
+            overwrites[me] = REPORT_BOT_OVERWRITE
 
         # IMPORTANT: use fetch_member so the reporter/opener/partner always get included,
         # even if they're not cached (no Members intent / cold start).
-        reporter = await _get_member(reporter_id) or interaction.user
-        opener = await _get_member(opener_id)
-        partner = await _get_member(partner_id)
+        # Uncached members are separate fetch_member round trips; run them together
+        reporter, opener, partner = await asyncio.gather(
+            _get_member(reporter_id), _get_member(opener_id), _get_member(partner_id)
+        )
+        reporter = reporter or interaction.user
 
-        for m in [reporter, opener, partner]:
+        for m in (reporter, opener, partner):
             if m:
-                overwrites[m] = discord.PermissionOverwrite(
-                    view_channel=True,
-                    send_messages=True,
-                    read_message_history=True,
-                    attach_files=True,
-                    embed_links=True,
-                )
+                overwrites[m] = REPORT_PARTICIPANT_OVERWRITE
 
         mod_role = guild.get_role(MOD_ROLE_ID)
         trial_role = guild.get_role(TRIAL_MOD_ROLE_ID)
-        for r in [mod_role, trial_role]:
+        for r in (mod_role, trial_role):
             if r:
-                overwrites[r] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, manage_messages=True)
+                overwrites[r] = REPORT_MOD_OVERWRITE
 
         topic = f"report_id={report_id} trade_id={trade_id}"
         report_channel = await guild.create_text_channel(
@@ -822,37 +1433,38 @@ class ScamReportModal(discord.ui.Modal, title="Report Trade Issue"):
         accused = guild.get_member(accused_id)
         accused_txt = accused.mention if accused else f"<@{accused_id}>"
 
-        embed = discord.Embed(title="🚨 Trade Report Opened", color=discord.Color.red())
-        embed.add_field(name="Report ID", value=f"`{report_id}`", inline=True)
-        embed.add_field(name="Trade ID", value=f"`{trade_id}`", inline=True)
-        embed.add_field(name="Reporter", value=interaction.user.mention, inline=True)
-        embed.add_field(name="Other Trader", value=accused_txt, inline=True)
-        embed.add_field(name="What happened", value=desc[:1024], inline=False)
-
-        if details:
-            embed.add_field(name="Trade details", value=details[:1024], inline=False)
-        if proof:
-            embed.add_field(name="Proof", value=proof[:1024], inline=False)
-        else:
-            embed.add_field(name="Proof", value="*Not provided yet — CLIP PROOF is needed for mods to take action.*", inline=False)
-            
-            embed.set_footer(text="Mods: use Mark Resolved when handled • You can add another trader if needed")
+        fields = [
+            ("Report ID", f"`{report_id}`", True),
+            ("Trade ID", f"`{trade_id}`", True),
+            ("Reporter", interaction.user.mention, True),
+            ("Other Trader", accused_txt, True),
+            ("What happened", desc[:1024], False),
+            ("Trade details", details[:1024] if details else None, False),
+            ("Proof", proof[:1024] if proof else "*Not provided yet — CLIP PROOF is needed for mods to take action.*", False),
+        ]
+        embed_data = {
+            "title": "🚨 Trade Report Opened",
+            "color": 0xE74C3C,  # discord.Color.red()
+            "fields": [{"name": fname, "value": value, "inline": inline} for fname, value, inline in fields if value],
+        }
+        if not proof:
+            embed_data["footer"] = {"text": "Mods: use Mark Resolved when handled • You can add another trader if needed"}
+        embed = discord.Embed.from_dict(embed_data)
 
-        view = ReportChannelView()
+        view = shared_view(ReportChannelView)
 
-        ping = ""
-        if mod_role:
-            ping += mod_role.mention + " "
-        if trial_role:
-            ping += trial_role.mention + " "
+        ping = _report_ping_cache.get(guild.id, "")
+        if ping == "":
+            ping = " ".join(r.mention for r in (mod_role, trial_role) if r) or None
+            _report_ping_cache[guild.id] = ping
 
         msg = await report_channel.send(
-            content=(ping.strip() if ping else None),
+            content=ping,
             embed=embed,
             view=view
         )
 
-        attach_report_channel(report_id, report_channel.id, msg.id)
+        await run_db(attach_report_channel, report_id, report_channel.id, msg.id)
 
         await interaction.response.send_message(
             f"✅ Report opened: {report_channel.mention}\n"
@@ -890,44 +1502,44 @@ class ResolveReportModal(discord.ui.Modal, title="Resolve Report"):
         if not isinstance(channel, discord.TextChannel):
             return await interaction.response.send_message("This must be used in a report channel.", ephemeral=True)
 
-        report = get_report(self.report_id)
+        report = await run_db(get_report, self.report_id)
         if not report:
             return await interaction.response.send_message("Report record not found.", ephemeral=True)
 
         await interaction.response.defer(ephemeral=True)
 
         # mark resolved in DB
-        resolve_report(self.report_id, interaction.user.id)
+        await run_db(resolve_report, self.report_id, interaction.user.id)
 
         guild = interaction.guild
-        cfg = get_config(guild.id)
-        receipts_id = int(cfg["report_receipts_channel_id"] or 0)
+        cfg = await config_for(guild.id)
+        receipts_id = cfg["report_receipts_channel_id"]
 
         ban_txt = str(self.ban_success.value).strip().lower()
         ban_txt = "Yes ✅" if ban_txt in ("yes", "y") else ("No ❌" if ban_txt in ("no", "n") else ban_txt)
 
         notes = str(self.side_notes.value).strip() if self.side_notes.value else ""
 
-        receipt_embed = discord.Embed(title="🧾 Report Receipt (Resolved)", color=discord.Color.green())
-        receipt_embed.add_field(name="Report ID", value=f"`{self.report_id}`", inline=True)
-        receipt_embed.add_field(name="Trade ID", value=f"`{report['trade_id']}`", inline=True)
-        receipt_embed.add_field(name="Resolved By", value=interaction.user.mention, inline=True)
-
-        receipt_embed.add_field(name="Scammer Ban Successful?", value=ban_txt, inline=False)
-
-        receipt_embed.add_field(name="Reporter", value=f"<@{int(report['reporter_id'])}>", inline=True)
-        receipt_embed.add_field(name="Opener", value=f"<@{int(report['opener_id'])}>", inline=True)
-        receipt_embed.add_field(name="Partner", value=f"<@{int(report['partner_id'])}>", inline=True)
-
-        receipt_embed.add_field(name="What happened", value=str(report["description"])[:1024], inline=False)
-
-        if report["trade_details"]:
-            receipt_embed.add_field(name="Trade details", value=str(report["trade_details"])[:1024], inline=False)
-        if report["proof_url"]:
-            receipt_embed.add_field(name="Proof", value=str(report["proof_url"])[:1024], inline=False)
-
-        if notes:
-            receipt_embed.add_field(name="Side notes", value=notes[:1024], inline=False)
+        # (name, value, inline); optional sections are skipped when empty
+        details, proof = report["trade_details"], report["proof_url"]
+        fields = [
+            ("Report ID", f"`{self.report_id}`", True),
+            ("Trade ID", f"`{report['trade_id']}`", True),
+            ("Resolved By", interaction.user.mention, True),
+            ("Scammer Ban Successful?", ban_txt, False),
+            ("Reporter", f"<@{report['reporter_id']}>", True),
+            ("Opener", f"<@{report['opener_id']}>", True),
+            ("Partner", f"<@{report['partner_id']}>", True),
+            ("What happened", str(report["description"])[:1024], False),
+            ("Trade details", str(details)[:1024] if details else None, False),
+            ("Proof", str(proof)[:1024] if proof else None, False),
+            ("Side notes", notes[:1024] or None, False),
+        ]
+        receipt_embed = discord.Embed.from_dict({
+            "title": "🧾 Report Receipt (Resolved)",
+            "color": 0x2ECC71,  # discord.Color.green()
+            "fields": [{"name": name, "value": value, "inline": inline} for name, value, inline in fields if value],
+        })
 
         # Send receipt (if configured)
         if receipts_id:
@@ -993,60 +1605,30 @@ class PendingTradeView(discord.ui.View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="Accept Trade", style=discord.ButtonStyle.success, custom_id="trade_accept")
-    async def accept(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID from message.", ephemeral=True)
-
-        trade = get_trade(trade_id)
+    @requires_trade("pending", "This trade is no longer pending.", "partner", "Only the tagged partner can accept.")
+    async def accept(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        trade = await run_db(update_trade, trade["trade_id"], expect_status="pending", status="active", accepted=1)
         if not trade:
-            return await interaction.response.send_message("Trade not found.", ephemeral=True)
-        if trade["status"] != "pending":
             return await interaction.response.send_message("This trade is no longer pending.", ephemeral=True)
-
-        if interaction.user.id != int(trade["partner_id"]):
-            return await interaction.response.send_message("Only the tagged partner can accept.", ephemeral=True)
-
-        update_trade(trade_id, status="active", accepted=1)
-        embed = build_trade_embed(interaction.guild, trade_id)
-        await interaction.response.edit_message(embed=embed, view=ActiveTradeView())
+        embed = await trade_embed(interaction.guild, trade, partner=interaction.user)
+        await interaction.response.edit_message(embed=embed, view=shared_view(ActiveTradeView))
 
     @discord.ui.button(label="Decline", style=discord.ButtonStyle.danger, custom_id="trade_decline")
-    async def decline(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID from message.", ephemeral=True)
-
-        trade = get_trade(trade_id)
+    @requires_trade("pending", "This trade is no longer pending.", "partner", "Only the tagged partner can decline.")
+    async def decline(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        trade = await run_db(update_trade, trade["trade_id"], expect_status="pending", status="declined")
         if not trade:
-            return await interaction.response.send_message("Trade not found.", ephemeral=True)
-        if trade["status"] != "pending":
             return await interaction.response.send_message("This trade is no longer pending.", ephemeral=True)
-
-        if interaction.user.id != int(trade["partner_id"]):
-            return await interaction.response.send_message("Only the tagged partner can decline.", ephemeral=True)
-
-        update_trade(trade_id, status="declined")
-        embed = build_trade_embed(interaction.guild, trade_id)
+        embed = await trade_embed(interaction.guild, trade, partner=interaction.user)
         await interaction.response.edit_message(embed=embed, view=None)
 
     @discord.ui.button(label="Cancel Request", style=discord.ButtonStyle.secondary, custom_id="trade_cancel")
-    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID from message.", ephemeral=True)
-
-        trade = get_trade(trade_id)
+    @requires_trade("pending", "This trade is no longer pending.", "opener", "Only the opener can cancel this request.")
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        trade = await run_db(update_trade, trade["trade_id"], expect_status="pending", status="cancelled")
         if not trade:
-            return await interaction.response.send_message("Trade not found.", ephemeral=True)
-        if trade["status"] != "pending":
             return await interaction.response.send_message("This trade is no longer pending.", ephemeral=True)
-
-        if interaction.user.id != int(trade["opener_id"]):
-            return await interaction.response.send_message("Only the opener can cancel this request.", ephemeral=True)
-
-        update_trade(trade_id, status="cancelled")
-        embed = build_trade_embed(interaction.guild, trade_id)
+        embed = await trade_embed(interaction.guild, trade, opener=interaction.user)
         await interaction.response.edit_message(embed=embed, view=None)
 
 
@@ -1059,59 +1641,27 @@ class ActiveTradeView(discord.ui.View):
         style=discord.ButtonStyle.primary,
         custom_id="trade_confirm_opener"
     )
-    async def confirm_opener(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
-
-        trade = get_trade(trade_id)
-        if not trade or trade["status"] != "active":
-            return await interaction.response.send_message("Trade not active.", ephemeral=True)
-
-        if interaction.user.id != int(trade["opener_id"]):
-            return await interaction.response.send_message("Only opener can confirm.", ephemeral=True)
-
-        update_trade(trade_id, opener_confirmed=1)
-        await self._refresh_or_finalize(interaction, trade_id)
+    @requires_trade("active", "Trade not active.", "opener", "Only opener can confirm.")
+    async def confirm_opener(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        await self._refresh_or_finalize(interaction, trade, "opener_confirmed")
 
     @discord.ui.button(
         label="Confirm Complete (Partner)",
         style=discord.ButtonStyle.primary,
         custom_id="trade_confirm_partner"
     )
-    async def confirm_partner(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
-
-        trade = get_trade(trade_id)
-        if not trade or trade["status"] != "active":
-            return await interaction.response.send_message("Trade not active.", ephemeral=True)
-
-        if interaction.user.id != int(trade["partner_id"]):
-            return await interaction.response.send_message("Only partner can confirm.", ephemeral=True)
-
-        update_trade(trade_id, partner_confirmed=1)
-        await self._refresh_or_finalize(interaction, trade_id)
+    @requires_trade("active", "Trade not active.", "partner", "Only partner can confirm.")
+    async def confirm_partner(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        await self._refresh_or_finalize(interaction, trade, "partner_confirmed")
 
     @discord.ui.button(
         label="🚨 Report Issue",
         style=discord.ButtonStyle.danger,
         custom_id="trade_report_button"
     )
-    async def report_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
-
-        trade = get_trade(trade_id)
-        if not trade or trade["status"] != "active":
-            return await interaction.response.send_message(
-                "Reports only allowed during active trades.",
-                ephemeral=True
-            )
-
-        await interaction.response.send_modal(ScamReportModal(trade_id))
+    @requires_trade("active", "Reports only allowed during active trades.")
+    async def report_button(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        await interaction.response.send_modal(ScamReportModal(trade["trade_id"]))
 
     @discord.ui.button(
         label="Force Close (Staff)",
@@ -1126,21 +1676,23 @@ class ActiveTradeView(discord.ui.View):
         if not trade_id:
             return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
 
-        update_trade(trade_id, status="cancelled")
-        embed = build_trade_embed(interaction.guild, trade_id)
+        trade = await run_db(update_trade, trade_id, status="cancelled")
+        if not trade:
+            return await interaction.response.send_message("Trade not found.", ephemeral=True)
+        embed = await trade_embed(interaction.guild, trade)
         await interaction.response.edit_message(embed=embed, view=None)
 
-    async def _refresh_or_finalize(self, interaction: discord.Interaction, trade_id: str):
-        trade = get_trade(trade_id)
+    async def _refresh_or_finalize(self, interaction: discord.Interaction, trade: sqlite3.Row, confirmed: str):
+        # The UPDATE itself decides completion from the other side's flag (see confirm_trade)
+        members = {"opener": interaction.user} if confirmed == "opener_confirmed" else {"partner": interaction.user}
+        trade = await run_db(confirm_trade, trade["trade_id"], confirmed)
         if not trade:
-            return await interaction.response.send_message("Trade not found.", ephemeral=True)
+            return await interaction.response.send_message("Trade not active.", ephemeral=True)
 
-        if int(trade["opener_confirmed"]) == 1 and int(trade["partner_confirmed"]) == 1:
-            update_trade(trade_id, status="completed")
-            embed = build_trade_embed(interaction.guild, trade_id)
-            await interaction.response.edit_message(embed=embed, view=CompletedTradeView())
+        embed = await trade_embed(interaction.guild, trade, **members)
+        if trade["status"] == "completed":
+            await interaction.response.edit_message(embed=embed, view=shared_view(CompletedTradeView))
         else:
-            embed = build_trade_embed(interaction.guild, trade_id)
             await interaction.response.edit_message(embed=embed, view=self)
 
 class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
@@ -1174,7 +1726,7 @@ class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
 
     async def on_submit(self, interaction: discord.Interaction):
         trade_id = self.trade_id.strip().upper()
-        trade_row = get_trade(trade_id)
+        trade_row = await run_db(get_trade, trade_id)
         if not trade_row:
             return await interaction.response.send_message("Trade not found.", ephemeral=True)
 
@@ -1205,8 +1757,8 @@ class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
         note = str(self.note.value).strip() if self.note.value else None
         proof_url = str(self.proof_url.value).strip() if self.proof_url.value else None
 
-        cfg = get_config(interaction.guild.id)
-        vouch_channel_id = int(cfg["vouch_channel_id"] or 0)
+        cfg = await config_for(interaction.guild.id)
+        vouch_channel_id = cfg["vouch_channel_id"]
         if not vouch_channel_id:
             return await interaction.response.send_message(
                 "Vouch channel isn’t set yet. Admins: use `/set_vouch_channel`.",
@@ -1220,13 +1772,10 @@ class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
                 ephemeral=True
             )
 
-        try:
-            add_vouch(interaction.guild.id, trade_id, target_id, voucher_id, stars, note, proof_url)
-        except sqlite3.IntegrityError:
+        result = await submit_vouch(interaction.guild.id, trade_id, target_id, voucher_id, stars, note, proof_url)
+        if result is None:
             return await interaction.response.send_message("You already vouched for this trade.", ephemeral=True)
-
-        total = vouch_count(interaction.guild.id, target_id)
-        avg = avg_stars(interaction.guild.id, target_id)
+        total, avg = result
 
         target_member = interaction.guild.get_member(target_id)
         tier_update = None
@@ -1238,11 +1787,14 @@ class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
         if trader_member is None:
             trader_member = await interaction.guild.fetch_member(target_id)
 
+        # Plain values in, so the builder does no DB or Member work of its own
+        trader_eid = await run_db(get_embark_id, interaction.guild.id, target_id)
         embed = build_vouch_embed(
-            interaction.guild,
             trade_id,
-            trader=trader_member,
-            voucher=interaction.user,
+            trader_mention=trader_member.mention,
+            trader_avatar_url=trader_member.display_avatar.url,
+            trader_eid=trader_eid,
+            voucher_mention=interaction.user.mention,
             stars=stars,
             total=total,
             avg=avg,
@@ -1252,7 +1804,7 @@ class VouchFromTradeModal(discord.ui.Modal, title="Leave a Vouch"):
         )
 
         await interaction.response.send_message(f"✅ Vouch logged! Posted in {vouch_channel.mention}.", ephemeral=True)
-        await vouch_channel.send(embed=embed)
+        spawn(vouch_channel.send(embed=embed), f"vouch log for {trade_id}")
 
         
 class CompletedTradeView(discord.ui.View):
@@ -1260,72 +1812,93 @@ class CompletedTradeView(discord.ui.View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="✅ Leave Vouch", style=discord.ButtonStyle.success, custom_id="trade_leave_vouch")
-    async def leave_vouch(self, interaction: discord.Interaction, button: discord.ui.Button):
-        trade_id = trade_id_from_message(interaction)
-        if not trade_id:
-            return await interaction.response.send_message("Couldn't read Trade ID.", ephemeral=True)
+    @requires_trade("completed", "This trade is not completed.", "participant", "Only trade participants can vouch.")
+    async def leave_vouch(self, interaction: discord.Interaction, button: discord.ui.Button, trade: sqlite3.Row):
+        await interaction.response.send_modal(VouchFromTradeModal(trade["trade_id"]))
 
-        trade = get_trade(trade_id)
-        if not trade or trade["status"] != "completed":
-            return await interaction.response.send_message("This trade is not completed.", ephemeral=True)
 
-        # Only participants can vouch
-        if interaction.user.id not in (int(trade["opener_id"]), int(trade["partner_id"])):
-            return await interaction.response.send_message("Only trade participants can vouch.", ephemeral=True)
-
-        await interaction.response.send_modal(VouchFromTradeModal(trade_id))
+# The button views hold no per-trade state (the trade/report id is read back from the
+# message), so one instance of each serves every message. Built on first use because
+# discord.py views need the running event loop.
+_shared_views: dict[type, discord.ui.View] = {}
 
+def shared_view(cls: type) -> discord.ui.View:
+    view = _shared_views.get(cls)
+    if view is None:
+        view = _shared_views[cls] = cls()
+    return view
 
 # -------------------- Auto-expire task --------------------
+WAL_TRUNCATE_EVERY = 60  # expire-loop iterations
+EXPIRE_EDIT_CONCURRENCY = 10
+_expire_edit_sem: Optional[asyncio.Semaphore] = None
+
+async def _expire_one(trade: sqlite3.Row):
+    global _expire_edit_sem
+    if _expire_edit_sem is None:
+        _expire_edit_sem = asyncio.Semaphore(EXPIRE_EDIT_CONCURRENCY)
+    trade_id = trade["trade_id"]
+    try:
+        guild = bot.get_guild(int(trade["guild_id"]))
+        if not guild:
+            return
+        channel = guild.get_channel(int(trade["channel_id"]))
+        if not isinstance(channel, discord.TextChannel):
+            return
+        embed = await trade_embed(guild, trade)
+        async with _expire_edit_sem:
+            # PartialMessage: edit by id without fetching the message first
+            await channel.get_partial_message(int(trade["message_id"])).edit(embed=embed, view=None)
+    except Exception as e:
+        logging.warning(f"Failed to expire/edit trade {trade_id}: {e}")
+
 @tasks.loop(minutes=1)
 async def expire_trades_loop():
     now_ts = int(time.time())
-    rows = find_expirable_trades(now_ts)
+    # The UPDATE's WHERE clause is the status re-check; only Discord edits remain per row
+    rows = await run_db(expire_stale_trades, now_ts)
 
-    for trade in rows:
-        trade_id = trade["trade_id"]
-        latest = get_trade(trade_id)
-        if not latest or latest["status"] not in ("pending", "active"):
-            continue
-
-        update_trade(trade_id, status="expired")
+    if rows:
+        await asyncio.gather(*(_expire_one(trade) for trade in rows))
 
+    # Autocheckpoints never shrink the -wal file; truncate it about once an hour
+    if expire_trades_loop.current_loop % WAL_TRUNCATE_EVERY == 0:
         try:
-            guild = bot.get_guild(int(latest["guild_id"]))
-            if not guild:
-                continue
-            channel = guild.get_channel(int(latest["channel_id"]))
-            if not isinstance(channel, discord.TextChannel):
-                continue
-            msg = await channel.fetch_message(int(latest["message_id"]))
-            await msg.edit(embed=build_trade_embed(guild, trade_id), view=None)
-        except Exception as e:
-            logging.warning(f"Failed to expire/edit trade {trade_id}: {e}")
+            await run_db(checkpoint_wal)
+        except sqlite3.Error as e:
+            logging.warning(f"WAL checkpoint failed: {e}")
+
+@tasks.loop(hours=24)
+async def optimize_db_loop():
+    # Keeps planner stats current as vouches/trades grow, without waiting for a restart
+    try:
+        await run_db(optimize_db)
+    except sqlite3.Error as e:
+        logging.warning(f"PRAGMA optimize failed: {e}")
 
 # -------------------- Trade channel reminder (anti-spam) --------------------
 @bot.event
 async def on_message(message: discord.Message):
-    global _last_trade_reminder_ts, _trade_chat_counter
-
     if message.author.bot or not message.guild:
         return
 
-    cfg = get_config(message.guild.id)
-    trade_channel_id = int(cfg["trade_channel_id"] or 0)
+    gid = message.guild.id
+    # config_for answers from _config_cache without a thread hop after the first message
+    trade_channel_id = (await config_for(gid))["trade_channel_id"]
 
     if trade_channel_id and message.channel.id == trade_channel_id:
-        _trade_chat_counter += 1
+        count = _trade_chat_counter.get(gid, 0) + 1
+        _trade_chat_counter[gid] = count
         now = int(time.time())
 
-        if _trade_chat_counter >= TRADE_REMINDER_MIN_MESSAGES and (now - _last_trade_reminder_ts) >= TRADE_REMINDER_COOLDOWN:
-            _last_trade_reminder_ts = now
-            _trade_chat_counter = 0
+        if count >= TRADE_REMINDER_MIN_MESSAGES and (now - _last_trade_reminder_ts.get(gid, 0)) >= TRADE_REMINDER_COOLDOWN:
+            _last_trade_reminder_ts[gid] = now
+            _trade_chat_counter[gid] = 0
             await message.channel.send(
                 "🧾 **Found a Raider to trade with?** Use **`/trade @user`** to open a Trade Ticket.\n"
                 "It keeps trades organized and unlocks vouches with a Trade ID ✅"
             )
-
-    await bot.process_commands(message)
+    # No bot.process_commands(): every command is a slash command on bot.tree
 
 
 # -------------------- Auto-VC (join-to-create) --------------------
@@ -1343,16 +1916,16 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
             trigger_ch = after.channel
             category = trigger_ch.category  # keep everything under the same category as the trigger channel
 
-            # Create the new VC
-            new_name = next_temp_vc_name(guild)
+            # Create the new VC (numbered from temp_vcs, not by scanning every voice channel)
+            slot = next_temp_vc_slot(guild.id)
             new_vc = await guild.create_voice_channel(
-                name=new_name,
+                name=temp_vc_name(slot),
                 category=category,
                 reason=f"Auto-VC created for {member} ({member.id})"
             )
 
             # Track in DB so we know which ones are safe to auto-delete + who the owner is
-            add_temp_vc(guild.id, new_vc.id, member.id)
+            await run_db(add_temp_vc, guild.id, new_vc.id, member.id, slot)
 
             # Move creator into the new VC
             await member.move_to(new_vc, reason="Moved to auto-created VC")
@@ -1366,7 +1939,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
                 if owner_id == member.id and len(ch.members) > 0:
                     import random as _random
                     new_owner = _random.choice(list(ch.members))
-                    set_temp_vc_owner(member.guild.id, ch.id, new_owner.id)
+                    await run_db(set_temp_vc_owner, member.guild.id, ch.id, new_owner.id)
                     try:
                         await new_owner.send(
                             f"🎙️ You are now the VC owner for **{ch.name}** in **{member.guild.name}**. "
@@ -1380,7 +1953,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
                     try:
                         await ch.delete(reason="Auto-VC cleanup (empty)")
                     finally:
-                        remove_temp_vc(member.guild.id, ch.id)
+                        await run_db(remove_temp_vc, member.guild.id, ch.id)
 
     except Exception as e:
         logging.warning(f"Auto-VC error: {e}")
@@ -1389,17 +1962,38 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
 def admin_only(interaction: discord.Interaction) -> bool:
     return interaction.user.guild_permissions.administrator
 def is_staff_member(member: discord.Member) -> bool:
-    if member.guild_permissions.administrator or member.guild_permissions.manage_guild:
+    # guild_permissions is recomputed from the member's roles on every access; read it once
+    perms = member.guild_permissions
+    if perms.administrator or perms.manage_guild:
         return True
-    role_ids = {r.id for r in getattr(member, "roles", [])}
-    return (MOD_ROLE_ID in role_ids) or (TRIAL_MOD_ROLE_ID in role_ids)
+    return member.get_role(MOD_ROLE_ID) is not None or member.get_role(TRIAL_MOD_ROLE_ID) is not None
+
+def per_user_cooldown(interaction: discord.Interaction):
+    return (interaction.guild_id, interaction.user.id)
+
+def deferred(ephemeral: bool = True):
+    """Ack the interaction before the command body runs, so DB work can't miss
+    Discord's 3-second deadline. The body replies with interaction.followup.send."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            await interaction.response.defer(ephemeral=ephemeral)
+            return await func(interaction, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
+# on_ready fires again after every gateway reconnect; the tree sync (a rate-limited
+# REST call) and view registration only need to happen once per process
+_ready_once = False
 
 @bot.event
 async def on_ready():
-    init_db()
+    global _ready_once
     logging.info(f"Logged in as {bot.user} (id: {bot.user.id})")
+    if _ready_once:
+        return
+    _ready_once = True
 
     if GUILD_ID:
         guild = discord.Object(id=int(GUILD_ID))
@@ -1410,49 +2004,60 @@ async def on_ready():
         await bot.tree.sync()
         logging.info("Synced global commands (can take time to appear)")
 
-    bot.add_view(PendingTradeView())
-    bot.add_view(ActiveTradeView())
-    bot.add_view(ReportChannelView())
-    bot.add_view(CompletedTradeView())
+    for cls in (PendingTradeView, ActiveTradeView, ReportChannelView, CompletedTradeView):
+        bot.add_view(shared_view(cls))
 
     if not expire_trades_loop.is_running():
         expire_trades_loop.start()
+    if not optimize_db_loop.is_running():
+        optimize_db_loop.start()
 
 # ---- Admin setup ----
+# default_permissions hides these from non-admins client-side; server owners can
+# override that per command, so the admin_only() check inside stays.
 @bot.tree.command(name="set_trade_channel", description="Admin: set the channel where trade tickets are posted")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
 async def set_trade_channel(interaction: discord.Interaction, channel: discord.TextChannel):
     if not admin_only(interaction):
         return await interaction.response.send_message("Admin only.", ephemeral=True)
 
-    set_config_value(interaction.guild.id, "trade_channel_id", channel.id)
+    await run_db(set_config_value, interaction.guild.id, "trade_channel_id", channel.id)
     await interaction.response.send_message(f"Trade channel set to {channel.mention}.", ephemeral=True)
 
 @bot.tree.command(name="set_vouch_channel", description="Admin: set the channel where vouches are posted")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
 async def set_vouch_channel(interaction: discord.Interaction, channel: discord.TextChannel):
     if not admin_only(interaction):
         return await interaction.response.send_message("Admin only.", ephemeral=True)
 
-    set_config_value(interaction.guild.id, "vouch_channel_id", channel.id)
+    await run_db(set_config_value, interaction.guild.id, "vouch_channel_id", channel.id)
     await interaction.response.send_message(f"Vouch channel set to {channel.mention}.", ephemeral=True)
 @bot.tree.command(name="set_report_receipts_channel", description="Admin: set the channel where report receipts are posted")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
 async def set_report_receipts_channel(interaction: discord.Interaction, channel: discord.TextChannel):
     if not admin_only(interaction):
         return await interaction.response.send_message("Admin only.", ephemeral=True)
 
-    set_config_value(interaction.guild.id, "report_receipts_channel_id", channel.id)
+    await run_db(set_config_value, interaction.guild.id, "report_receipts_channel_id", channel.id)
     await interaction.response.send_message(f"Report receipts channel set to {channel.mention}.", ephemeral=True)
 
 
 
 @bot.tree.command(name="setup_roles", description="Admin: set the role IDs for New/Verified/Trusted tiers")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
 async def setup_roles(interaction: discord.Interaction, new_role: discord.Role, verified_role: discord.Role, trusted_role: discord.Role):
     if not admin_only(interaction):
         return await interaction.response.send_message("Admin only.", ephemeral=True)
 
     gid = interaction.guild.id
-    set_config_value(gid, "role_new_id", new_role.id)
-    set_config_value(gid, "role_verified_id", verified_role.id)
-    set_config_value(gid, "role_trusted_id", trusted_role.id)
+    await run_db(
+        set_config_values, gid,
+        role_new_id=new_role.id, role_verified_id=verified_role.id, role_trusted_id=trusted_role.id,
+    )
 
     await interaction.response.send_message(
         f"Roles set:\n- New Trader: {new_role.mention}\n- Verified Trader: {verified_role.mention}\n- Trusted Trader: {trusted_role.mention}",
@@ -1460,6 +2065,8 @@ async def setup_roles(interaction: discord.Interaction, new_role: discord.Role,
     )
 
 @bot.tree.command(name="set_thresholds", description="Admin: set vouch thresholds for each tier")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
 async def set_thresholds(interaction: discord.Interaction, new: int = 1, verified: int = 5, trusted: int = 15):
     if not admin_only(interaction):
         return await interaction.response.send_message("Admin only.", ephemeral=True)
@@ -1467,9 +2074,10 @@ async def set_thresholds(interaction: discord.Interaction, new: int = 1, verifie
         return await interaction.response.send_message("Use numbers like: new <= verified <= trusted.", ephemeral=True)
 
     gid = interaction.guild.id
-    set_config_value(gid, "thresh_new", int(new))
-    set_config_value(gid, "thresh_verified", int(verified))
-    set_config_value(gid, "thresh_trusted", int(trusted))
+    await run_db(
+        set_config_values, gid,
+        thresh_new=int(new), thresh_verified=int(verified), thresh_trusted=int(trusted),
+    )
 
     await interaction.response.send_message(
         f"Thresholds set:\n- New Trader: {new}+\n- Verified Trader: {verified}+\n- Trusted Trader: {trusted}+",
@@ -1489,57 +2097,60 @@ async def help_cmd(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # ---- Embark ID ----
+# Name (no '#') + '#' + 3-6 digit tag; the name length gets its own message below
+_EMBARK_RE = re.compile(r"^([^#]+)#(\d{3,6})$")
+
 @bot.tree.command(name="embark", description="Set your Embark ID (example: Name#1234)")
 @app_commands.describe(embark_id="Example: RaiderName#1234")
 async def embark(interaction: discord.Interaction, embark_id: str):
     embark_id = embark_id.strip()
-    if "#" not in embark_id:
-        return await interaction.response.send_message("Use format like: `Name#1234`", ephemeral=True)
-
-    name, tag = embark_id.split("#", 1)
-    if not name or not tag.isdigit() or not (3 <= len(tag) <= 6):
+    m = _EMBARK_RE.match(embark_id)
+    if not m:
+        if "#" not in embark_id:
+            return await interaction.response.send_message("Use format like: `Name#1234`", ephemeral=True)
         return await interaction.response.send_message("Use format like: `Name#1234` (numbers after #).", ephemeral=True)
 
+    name, tag = m.groups()
     if len(name) > 20:
         return await interaction.response.send_message("Name part is too long. Keep it under ~20 chars.", ephemeral=True)
 
-    set_embark_id(interaction.guild.id, interaction.user.id, f"{name}#{tag}")
+    await run_db(set_embark_id, interaction.guild.id, interaction.user.id, f"{name}#{tag}")
     await interaction.response.send_message(f"✅ Saved your Embark ID as **`{name}#{tag}`**", ephemeral=True)
 
 # ---- Trade command ----
 @bot.tree.command(name="trade", description="Open a trade ticket with another user (posts in Trade Channel)")
+@deferred(ephemeral=True)
 async def trade(interaction: discord.Interaction, user: discord.Member):
+    guild = interaction.guild
+    gid = guild.id
+    uid = interaction.user.id
     if user.bot:
-        return await interaction.response.send_message("You can’t open trades with bots.", ephemeral=True)
-    if user.id == interaction.user.id:
-        return await interaction.response.send_message("You can’t open a trade with yourself.", ephemeral=True)
+        return await interaction.followup.send("You can’t open trades with bots.", ephemeral=True)
+    if user.id == uid:
+        return await interaction.followup.send("You can’t open a trade with yourself.", ephemeral=True)
 
-    cfg = get_config(interaction.guild.id)
-    trade_channel_id = int(cfg["trade_channel_id"] or 0)
+    cfg = await config_for(gid)
+    trade_channel_id = cfg["trade_channel_id"]
     if not trade_channel_id:
-        return await interaction.response.send_message(
+        return await interaction.followup.send(
             "Trade channel isn’t set yet. Admins: use `/set_trade_channel`.",
             ephemeral=True
         )
 
-    trade_channel = interaction.guild.get_channel(trade_channel_id)
+    trade_channel = guild.get_channel(trade_channel_id)
     if not isinstance(trade_channel, discord.TextChannel):
-        return await interaction.response.send_message(
+        return await interaction.followup.send(
             "Trade channel is invalid. Admins: run `/set_trade_channel` again.",
             ephemeral=True
         )
 
-    trade_id = create_trade(interaction.guild.id, interaction.user.id, user.id)
-    embed = build_trade_embed(interaction.guild, trade_id)
-    view = PendingTradeView()
+    trade_id = await run_db(create_trade, gid, uid, user.id)
+    trade = await run_db(get_trade, trade_id)  # cached by create_trade
+    eids = await run_db(get_embark_ids, gid, [uid, user.id])
+    embed = build_trade_embed(guild, trade, eids, opener=interaction.user, partner=user)
 
-    await interaction.response.send_message(
-        f"Trade ticket created ✅ Posted in {trade_channel.mention}\nTrade ID: `{trade_id}`",
-        ephemeral=True
-    )
-    # Soft Embark-ID nudge (does NOT block trading)
-    opener_eid = get_embark_id(interaction.guild.id, interaction.user.id)
-    partner_eid = get_embark_id(interaction.guild.id, user.id)
+    # Soft Embark-ID nudge (does NOT block trading), folded into the one confirmation message
+    opener_eid, partner_eid = eids[uid], eids[user.id]
 
     tip_lines = []
     if not opener_eid:
@@ -1547,40 +2158,37 @@ async def trade(interaction: discord.Interaction, user: discord.Member):
     if not partner_eid:
         tip_lines.append(f"• {user.mention} doesn’t have an Embark ID set yet (it will show **Not set**).")
 
+    content = f"Trade ticket created ✅ Posted in {trade_channel.mention}\nTrade ID: `{trade_id}`"
     if tip_lines:
-        await interaction.followup.send(
-            "🧾 **Trade Tip**\n" + "\n".join(tip_lines) +
-            "\nSetting it makes adding each other in-game way faster ✅",
-            ephemeral=True
+        content += (
+            "\n\n🧾 **Trade Tip**\n" + "\n".join(tip_lines) +
+            "\nSetting it makes adding each other in-game way faster ✅"
         )
 
-    msg = await trade_channel.send(content=f"{user.mention}", embed=embed, view=view)
-    set_trade_message(trade_id, trade_channel.id, msg.id)
+    # Post before confirming, so a failed send surfaces instead of a false "Posted in"
+    msg = await trade_channel.send(content=user.mention, embed=embed, view=shared_view(PendingTradeView))
+    await run_db(set_trade_message, trade_id, trade_channel.id, msg.id)
+
+    await interaction.followup.send(content, ephemeral=True)
 
 # ---- Trade History ----
 @bot.tree.command(name="trade_history", description="Show a user's last 5 trades (private)")
+@app_commands.checks.cooldown(1, 3.0, key=per_user_cooldown)
+@deferred(ephemeral=True)
 async def trade_history(interaction: discord.Interaction, user: discord.Member):
-    rows = last_trades_for_user(interaction.guild.id, user.id, limit=5)
+    guild = interaction.guild
+    gid = guild.id
+    rows = await run_db(last_trades_for_user, gid, user.id, limit=5)
     if not rows:
-        return await interaction.response.send_message("No trades found for that user yet.", ephemeral=True)
-
-    lines = []
-    for r in rows:
-        opener_id = int(r["opener_id"])
-        partner_id = int(r["partner_id"])
-        other_id = partner_id if user.id == opener_id else opener_id
-        other = interaction.guild.get_member(other_id)
-        other_txt = other.mention if other else f"<@{other_id}>"
-        date_txt = time.strftime("%Y-%m-%d", time.localtime(int(r["created_at"])))
-        lines.append(f"`{r['trade_id']}` • **{str(r['status']).title()}** • with {other_txt} • {date_txt}")
+        return await interaction.followup.send("No trades found for that user yet.", ephemeral=True)
 
     embed = discord.Embed(
         title=f"🗂️ Trade History — {user.display_name}",
-        description="\n".join(lines),
+        description="\n".join(f"{trade_line(guild, user.id, r)} • {r['date_txt']}" for r in rows),
         color=discord.Color.blurple()
     )
     embed.set_footer(text="Shows last 5 trades (any status)")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 # ---- Report: add extra user (staff) ----
 @bot.tree.command(name="report_add_user", description="Staff: add another user to the current report channel")
 async def report_add_user(interaction: discord.Interaction, user: discord.Member):
@@ -1595,8 +2203,7 @@ async def report_add_user(interaction: discord.Interaction, user: discord.Member
     if not report_id:
         return await interaction.response.send_message("This channel doesn't look like a report channel.", ephemeral=True)
 
-    overwrite = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, attach_files=True, embed_links=True)
-    await channel.set_permissions(user, overwrite=overwrite, reason=f"Added to report {report_id} by staff")
+    await channel.set_permissions(user, overwrite=REPORT_PARTICIPANT_OVERWRITE, reason=f"Added to report {report_id} by staff")
     await interaction.response.send_message(f"✅ Added {user.mention} to this report channel.", ephemeral=True)
 
 
@@ -1610,6 +2217,7 @@ async def report_add_user(interaction: discord.Interaction, user: discord.Member
     note="Short note (optional)",
     proof_url="Link to proof (optional)"
 )
+@deferred(ephemeral=True)
 async def vouch(
     interaction: discord.Interaction,
     user: discord.Member,
@@ -1618,66 +2226,68 @@ async def vouch(
     note: Optional[str] = None,
     proof_url: Optional[str] = None
 ):
+    guild = interaction.guild
+    gid = guild.id
+    voucher_id = interaction.user.id
     if user.bot:
-        return await interaction.response.send_message("You can’t vouch for bots.", ephemeral=True)
-    if user.id == interaction.user.id:
-        return await interaction.response.send_message("You can’t vouch for yourself.", ephemeral=True)
+        return await interaction.followup.send("You can’t vouch for bots.", ephemeral=True)
+    if user.id == voucher_id:
+        return await interaction.followup.send("You can’t vouch for yourself.", ephemeral=True)
 
-    cfg = get_config(interaction.guild.id)
-    vouch_channel_id = int(cfg["vouch_channel_id"] or 0)
+    cfg = await config_for(gid)
+    vouch_channel_id = cfg["vouch_channel_id"]
     if not vouch_channel_id:
-        return await interaction.response.send_message(
+        return await interaction.followup.send(
             "Vouch channel isn’t set yet. Admins: use `/set_vouch_channel`.",
             ephemeral=True
         )
 
-    vouch_channel = interaction.guild.get_channel(vouch_channel_id)
+    vouch_channel = guild.get_channel(vouch_channel_id)
     if not isinstance(vouch_channel, discord.TextChannel):
-        return await interaction.response.send_message(
+        return await interaction.followup.send(
             "Vouch channel is invalid. Admins: run `/set_vouch_channel` again.",
             ephemeral=True
         )
 
     trade_id = trade_id.strip().upper()
-    trade_row = get_trade(trade_id)
+    trade_row = await run_db(get_trade, trade_id)
     if not trade_row:
-        return await interaction.response.send_message("That Trade ID doesn’t exist.", ephemeral=True)
+        return await interaction.followup.send("That Trade ID doesn’t exist.", ephemeral=True)
 
-    if int(trade_row["guild_id"]) != interaction.guild.id:
-        return await interaction.response.send_message("That Trade ID is not for this server.", ephemeral=True)
+    if int(trade_row["guild_id"]) != gid:
+        return await interaction.followup.send("That Trade ID is not for this server.", ephemeral=True)
 
     if trade_row["status"] != "completed":
-        return await interaction.response.send_message("That trade is not completed yet.", ephemeral=True)
+        return await interaction.followup.send("That trade is not completed yet.", ephemeral=True)
 
     opener_id = int(trade_row["opener_id"])
     partner_id = int(trade_row["partner_id"])
-    voucher_id = interaction.user.id
     target_id = user.id
 
     if voucher_id not in (opener_id, partner_id):
-        return await interaction.response.send_message("Only trade participants can vouch for that trade.", ephemeral=True)
+        return await interaction.followup.send("Only trade participants can vouch for that trade.", ephemeral=True)
 
     if {voucher_id, target_id} != {opener_id, partner_id}:
-        return await interaction.response.send_message("You must vouch for the other person in that Trade ID.", ephemeral=True)
-
-    try:
-        add_vouch(interaction.guild.id, trade_id, target_id, voucher_id, int(stars), note, proof_url)
-    except sqlite3.IntegrityError:
-        return await interaction.response.send_message("You already vouched for this trade.", ephemeral=True)
+        return await interaction.followup.send("You must vouch for the other person in that Trade ID.", ephemeral=True)
 
-    total = vouch_count(interaction.guild.id, target_id)
-    avg = avg_stars(interaction.guild.id, target_id)
+    result = await submit_vouch(gid, trade_id, target_id, voucher_id, int(stars), note, proof_url)
+    if result is None:
+        return await interaction.followup.send("You already vouched for this trade.", ephemeral=True)
+    total, avg = result
 
     tier_update = None
-    target_member = interaction.guild.get_member(target_id)
+    target_member = guild.get_member(target_id)
     if target_member:
         tier_update = await apply_roles(target_member, total)
 
+    trader = target_member or user
+    trader_eid = await run_db(get_embark_id, gid, target_id)
     embed = build_vouch_embed(
-        interaction.guild,
         trade_id,
-        trader=target_member or user,
-        voucher=interaction.user,
+        trader_mention=trader.mention,
+        trader_avatar_url=trader.display_avatar.url,
+        trader_eid=trader_eid,
+        voucher_mention=interaction.user.mention,
         stars=int(stars),
         total=total,
         avg=avg,
@@ -1686,23 +2296,21 @@ async def vouch(
         proof_url=proof_url
     )
 
-    await interaction.response.send_message(f"Logged ✅ Posted in {vouch_channel.mention}.", ephemeral=True)
-    await vouch_channel.send(embed=embed)
+    await interaction.followup.send(f"Logged ✅ Posted in {vouch_channel.mention}.", ephemeral=True)
+    spawn(vouch_channel.send(embed=embed), f"vouch log for {trade_id}")
 
 # ---- Rep stays private ----
 @bot.tree.command(name="rep", description="Check a user's vouch count and tier (private)")
+@deferred(ephemeral=True)
 async def rep(interaction: discord.Interaction, user: Optional[discord.Member] = None):
     user = user or interaction.user
     gid = interaction.guild.id
 
-    total = vouch_count(gid, user.id)
-    avg = avg_stars(gid, user.id)
-    eid = get_embark_id(gid, user.id)
-
-    cfg = get_config(gid)
-    tier = trader_tier_label(user if isinstance(user, discord.Member) else None, total, cfg)
+    total, avg = await run_db(vouch_stats, gid, user.id)
+    eid = await run_db(get_embark_id, gid, user.id)
 
-    badges = user_badges(user if isinstance(user, discord.Member) else None)
+    cfg = await config_for(gid)
+    tier, badges = trader_profile(user, total, cfg)
 
     embed = discord.Embed(title="📈 Trader Rep", color=discord.Color.blurple())
     embed.add_field(name="User", value=user.mention, inline=True)
@@ -1726,39 +2334,29 @@ async def rep(interaction: discord.Interaction, user: Optional[discord.Member] =
         embed.add_field(name="Staff", value=badges["staff"], inline=False)
 
     embed.set_footer(text="Private • Vouches require completed trades (Trade ID).")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="stats", description="Public trader stats & success rate")
+@app_commands.checks.cooldown(1, 3.0, key=per_user_cooldown)
+@deferred(ephemeral=False)
 async def stats_cmd(interaction: discord.Interaction, user: Optional[discord.Member] = None):
     user = user or interaction.user
-    gid = interaction.guild.id
-
-    # Vouch stats
-    total_vouches = vouch_count(gid, user.id)
-    avg_rating = avg_stars(gid, user.id)
-
-    # Trade stats
-    tstats = trade_stats_for_user(gid, user.id)
-    total_trades = tstats["total"]
-    completed = tstats["completed"]
-    failed = tstats["failed"]
+    guild = interaction.guild
+    gid = guild.id
+
+    # Vouch + trade stats + Embark ID + recent trades
+    summary = await run_db_once(("summary", gid, user.id), get_user_summary, gid, user.id, 3)
+    total_vouches, avg_rating = summary["vouches"], summary["avg_stars"]
+    total_trades = summary["total"]
+    completed = summary["completed"]
+    failed = summary["failed"]
     success_rate = (completed / total_trades * 100) if total_trades > 0 else 0
 
-    # Recent trades
-    recent = last_trades_for_user(gid, user.id, limit=3)
-    recent_lines = []
-    for r in recent:
-        opener_id = int(r["opener_id"])
-        partner_id = int(r["partner_id"])
-        other_id = partner_id if user.id == opener_id else opener_id
-        other = interaction.guild.get_member(other_id)
-        other_txt = other.mention if other else f"<@{other_id}>"
-        recent_lines.append(f"`{r['trade_id']}` • **{str(r['status']).title()}** • with {other_txt}")
-
-    eid = get_embark_id(gid, user.id)
-    cfg = get_config(gid)
-    tier = trader_tier_label(user if isinstance(user, discord.Member) else None, total_vouches, cfg)
-    badges = user_badges(user if isinstance(user, discord.Member) else None)
+    recent = summary["recent"]
+
+    eid = summary["embark_id"]
+    cfg = await config_for(gid)
+    tier, badges = trader_profile(user, total_vouches, cfg)
 
     embed = discord.Embed(
         title=f"📊 Trader Stats — {user.display_name}",
@@ -1793,11 +2391,11 @@ async def stats_cmd(interaction: discord.Interaction, user: Optional[discord.Mem
         inline=False
     )
 
-    if recent_lines:
-        embed.add_field(name="🗂 Recent Activity", value="\n".join(recent_lines), inline=False)
+    if recent:
+        embed.add_field(name="🗂 Recent Activity", value="\n".join(trade_line(guild, user.id, r) for r in recent), inline=False)
 
     embed.set_footer(text="Public stats • Based on tracked trade tickets")
-    await interaction.response.send_message(embed=embed, ephemeral=False)
+    await interaction.followup.send(embed=embed, ephemeral=False)
 
 @bot.tree.command(name="vc_limit", description="VC owner: set max members for your Auto VC (0 = unlimited)")
 @app_commands.describe(limit="Max members allowed in your Auto VC (0 = unlimited)")
@@ -1826,34 +2424,49 @@ async def vc_limit(interaction: discord.Interaction, limit: app_commands.Range[i
     await interaction.response.send_message(f"✅ **{ch.name}** max members set to **{txt}**.", ephemeral=True)
 
 @bot.tree.command(name="toptraders", description="Show top traders (public)")
+@app_commands.checks.cooldown(1, 3.0, key=per_user_cooldown)
 async def toptraders_cmd(interaction: discord.Interaction):
-    gid = interaction.guild.id
-    cfg = get_config(gid)
+    guild = interaction.guild
+    gid = guild.id
 
-    top = top_traders(gid, limit=10)
+    # Not @deferred: the empty-board reply must stay ephemeral, and a public defer
+    # would fix the followup's visibility. top_traders is a cached index read.
+    top = await run_db_once(("top", gid), top_traders, gid, limit=10)
     if not top:
         return await interaction.response.send_message("No vouches yet.", ephemeral=True)
+    await interaction.response.defer(ephemeral=False)
 
-    lines_out = []
-    for i, (uid, v, a) in enumerate(top, start=1):
-        member = interaction.guild.get_member(uid)
+    cfg = await config_for(gid)
+
+    # Tier/region/platform tags need the Member; resolve the whole board at once
+    members = await prefetch_members(guild, [uid for uid, _, _ in top])
+
+    def board_line(i: int, uid: int, v: int, a: float) -> str:
+        member = members.get(uid)
         name = member.mention if member else f"<@{uid}>"
 
         # Leaderboard extras: ONLY Region + Platform + Trader Tier
+        # Only region/platform are shown, so skip user_badges' playstyle/staff scans
         tier = trader_tier_label(member, v, cfg)
-        badges = user_badges(member)
-        tags = [t for t in [tier, badges["region"], badges["platform"]] if t and t != "Unranked"]
-
-        tag_txt = f" • {' • '.join(tags)}" if tags else ""
-        lines_out.append(f"**#{i}** {name} — **{v}** vouches — **{a:.2f}/5** ⭐{tag_txt}")
+        if member:
+            region = pick_single_role_name(member, REGION_ROLE_NAMES)
+            platform = pick_single_role_name(member, PLATFORM_ROLE_NAMES)
+        else:
+            region = platform = None
+        tag_txt = "".join(f" • {t}" for t in (tier, region, platform) if t and t != "Unranked")
+        return f"**#{i}** {name} — **{v}** vouches — **{a:.2f}/5** ⭐{tag_txt}"
 
-    embed = discord.Embed(title="🏆 Top Traders", description="\n".join(lines_out), color=discord.Color.gold())
+    desc = "\n".join(board_line(i, uid, v, a) for i, (uid, v, a) in enumerate(top, start=1))
+    embed = discord.Embed(title="🏆 Top Traders", description=desc, color=discord.Color.gold())
     embed.set_footer(text="Ranked by vouches • Tie-breaker: avg rating")
-    await interaction.response.send_message(embed=embed, ephemeral=False)
+    await interaction.followup.send(embed=embed, ephemeral=False)
 
 if not TOKEN:
     raise RuntimeError("Missing DISCORD_TOKEN environment variable")
 
+# Schema setup runs once per process (on_ready fires again on every reconnect)
+init_db()
+load_temp_vcs()
 bot.run(TOKEN)
 
 